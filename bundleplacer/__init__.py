@@ -17,3 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """ Machine placement controller and UI """
+
+import os
+import sys
+
+# FIXME: Plan to make cloudinstall a non private library
+# Searched after site-packages, so it doesn't slow down other imports:
+lib_dir = os.path.abspath('/usr/share/openstack')
+if os.path.isdir(lib_dir) and lib_dir not in sys.path:
+    sys.path.append(lib_dir)
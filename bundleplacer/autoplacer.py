@@ -0,0 +1,493 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+from multiprocessing import cpu_count
+import random
+import time
+
+from bundleplacer.assignmenttype import AssignmentType
+
+log = logging.getLogger('bundleplacer')
+
+
+FIRST_FIT_DECREASING = 'ffd'
+BEST_FIT_DECREASING = 'bfd'
+LOCAL_SEARCH = 'search'
+STRATEGIES = (FIRST_FIT_DECREASING, BEST_FIT_DECREASING, LOCAL_SEARCH)
+DEFAULT_STRATEGY = BEST_FIT_DECREASING
+
+# seconds LOCAL_SEARCH may run for:
+DEFAULT_BUDGET = 2.0
+# LOCAL_SEARCH starts over from a new random order after this many
+# tries without improving:
+RESTART_AFTER = 25
+# and gives up, even with budget left, after this many tries without
+# improving on the best solution:
+GIVE_UP_AFTER = 8 * RESTART_AFTER
+
+# resource dimensions packed, as constraint keys:
+DIMENSIONS = ('cpu_cores', 'mem', 'storage')
+
+# preferred order of assignment types for units that share a machine,
+# and for units that get a machine to themselves:
+SHARED_ATYPES = (AssignmentType.LXC, AssignmentType.KVM)
+EXCLUSIVE_ATYPES = (AssignmentType.BareMetal, AssignmentType.KVM,
+                    AssignmentType.LXC)
+
+
+def _number(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v
+    return 0
+
+
+# One unit of a charm to place.
+#
+# demand - tuple of the unit's constraints for each of DIMENSIONS
+# feasible - bitmask of the machine indexes that satisfy its constraints
+# exclusive - if True, the unit gets a machine to itself
+# conflicts - names of charms whose units can't share its machine
+Unit = namedtuple('Unit', ['charm_name', 'atype', 'demand', 'feasible',
+                           'exclusive', 'conflicts'])
+
+
+class PlacementProblem:
+
+    """The input to the auto-placer, reduced to names, numbers and
+    bitmasks so that it is cheap to copy and can be pickled.
+
+    Machines are indexed in ascending order of size, so the lowest set
+    bit of a mask of machines is the smallest one, and the highest the
+    largest.
+
+    machine_ids - instance id of each machine
+
+    capacity - tuple of each machine's value for each of DIMENSIONS
+
+    units - list of Unit to place
+    """
+
+    def __init__(self, machine_ids, capacity, units):
+        self.machine_ids = machine_ids
+        self.capacity = capacity
+        self.units = units
+        # largest value of each dimension, for comparing sizes:
+        self._top = [max([c[d] for c in capacity] or [0])
+                     for d in range(len(DIMENSIONS))]
+
+    def __repr__(self):
+        return "<PlacementProblem {} units, {} machines>".format(
+            len(self.units), len(self.machine_ids))
+
+    @classmethod
+    def from_charms(cls, charm_classes, machines, counts=None):
+        """Builds the problem of placing required_num_units() units of each
+        charm class on machines, or counts[charm_name] units if given.
+
+        Isolated charms, and charms that can only be deployed to bare
+        metal, get a machine to themselves. Other charms go in
+        containers that share machines, up to the machines' capacity.
+        """
+        # imported here so the CLI can read STRATEGIES without
+        # importing cloudinstall:
+        from bundleplacer.machinetable import MachineTable, NUMERIC_KEYS
+
+        def capacity(m):
+            return tuple(_number(getattr(m, NUMERIC_KEYS[d]))
+                         for d in DIMENSIONS)
+
+        machines = sorted(machines, key=capacity)
+        table = MachineTable(machines)
+        feasible = table.feasibility(charm_classes)
+
+        names = set(cc.charm_name for cc in charm_classes)
+        conflicts = defaultdict(set)
+        for cc in charm_classes:
+            for other in cc.conflicts:
+                if other in names:
+                    conflicts[cc.charm_name].add(other)
+                    conflicts[other].add(cc.charm_name)
+
+        units = []
+        for cc in charm_classes:
+            allowed = cc.allowed_assignment_types
+            shared = [a for a in SHARED_ATYPES if a in allowed]
+            if cc.isolate or len(shared) == 0:
+                exclusive = True
+                atype = next((a for a in EXCLUSIVE_ATYPES if a in allowed),
+                             AssignmentType.BareMetal)
+            else:
+                exclusive = False
+                atype = shared[0]
+            demand = tuple(_number(cc.constraints.get(d, 0))
+                           for d in DIMENSIONS)
+            # units of a charm share one tuple, which pickles once:
+            unit = Unit(cc.charm_name, atype, demand,
+                        feasible[cc.charm_name], exclusive,
+                        tuple(conflicts[cc.charm_name]))
+            if counts is None:
+                n = cc.required_num_units()
+            else:
+                n = counts.get(cc.charm_name, 0)
+            units.extend([unit] * n)
+
+        return cls([m.instance_id for m in machines],
+                   [capacity(m) for m in machines], units)
+
+    def _relative(self, values):
+        "Sums values relative to the largest machine in each dimension"
+        return sum(v / t for v, t in zip(values, self._top) if t > 0)
+
+    def unit_order(self, rng=None):
+        """Returns unit indexes largest first: exclusive units, then by
+        demand relative to the largest machine.
+
+        If rng is a random.Random, sizes are jittered by up to 30% to
+        give a different but still roughly decreasing order.
+        """
+        def size(u):
+            unit = self.units[u]
+            s = self._relative(unit.demand)
+            if rng is not None:
+                s *= rng.uniform(0.7, 1.3)
+            return (unit.exclusive, s)
+
+        return sorted(range(len(self.units)), key=size, reverse=True)
+
+    def machine_size(self, i):
+        return self._relative(self.capacity[i])
+
+    def lower_bound(self):
+        """Returns a number of machines no solution can do better than:
+        one per exclusive unit, plus as many as the most units of a
+        single shared charm."""
+        exclusive = 0
+        shared = defaultdict(int)
+        for unit in self.units:
+            if unit.exclusive:
+                exclusive += 1
+            else:
+                shared[unit.charm_name] += 1
+        return exclusive + max(shared.values() or [0])
+
+    def min_unplaced(self):
+        """Returns the number of units no solution can place: units with
+        no feasible machine, and units of a charm beyond the number of
+        machines feasible for it."""
+        by_charm = defaultdict(list)
+        for unit in self.units:
+            by_charm[unit.charm_name].append(unit)
+        n = 0
+        for units in by_charm.values():
+            feasible = 0
+            for unit in units:
+                feasible |= unit.feasible
+            n += max(0, len(units) - bin(feasible).count('1'))
+        return n
+
+
+class PlacementSolution:
+
+    """A machine index (or None) for each unit of a PlacementProblem."""
+
+    def __init__(self, problem, machine_of):
+        self.problem = problem
+        self.machine_of = machine_of
+
+    def __repr__(self):
+        return "<PlacementSolution {} machines, {} unplaced>".format(
+            self.machines_used(), len(self.unplaced()))
+
+    def machines_used(self):
+        return len(set(m for m in self.machine_of if m is not None))
+
+    def unplaced(self):
+        """Returns the indexes of units that couldn't be placed."""
+        return [u for u, m in enumerate(self.machine_of) if m is None]
+
+    def score(self):
+        """Lower is better: fewest units unplaced, then fewest machines,
+        then the smallest machines, leaving the most headroom in the
+        ones that remain free."""
+        used = set(m for m in self.machine_of if m is not None)
+        return (len(self.unplaced()), len(used),
+                sum(self.problem.machine_size(m) for m in used))
+
+    def assignments(self, charm_classes):
+        """Returns {instance_id: {atype: [charm class]}}, the same shape
+        as gen_defaults()."""
+        by_name = {cc.charm_name: cc for cc in charm_classes}
+        assignments = defaultdict(lambda: defaultdict(list))
+        for unit, m in zip(self.problem.units, self.machine_of):
+            if m is None:
+                continue
+            iid = self.problem.machine_ids[m]
+            assignments[iid][unit.atype].append(by_name[unit.charm_name])
+        return assignments
+
+
+def _fits(demand, free):
+    return all(d <= f for d, f in zip(demand, free))
+
+
+def _shrink(problem, machine_of, free_mask):
+    """Moves the units on each shared machine, largest machine first,
+    to the smallest free machine that satisfies and holds all of them.
+    The number of machines used stays the same, but the ones left free
+    are the largest.
+    """
+    units_on = defaultdict(list)
+    for u, m in enumerate(machine_of):
+        if m is not None and not problem.units[u].exclusive:
+            units_on[m].append(u)
+
+    for m in sorted(units_on, reverse=True):
+        us = units_on[m]
+        load = tuple(sum(problem.units[u].demand[d] for u in us)
+                     for d in range(len(DIMENSIONS)))
+        # only machines indexed below m are smaller:
+        candidates = free_mask & ((1 << m) - 1)
+        for u in us:
+            candidates &= problem.units[u].feasible
+        while candidates:
+            low = candidates & -candidates
+            i = low.bit_length() - 1
+            if _fits(load, problem.capacity[i]):
+                for u in us:
+                    machine_of[u] = i
+                free_mask = (free_mask | 1 << m) & ~low
+                break
+            candidates ^= low
+
+
+def pack(problem, strategy=DEFAULT_STRATEGY, order=None):
+    """Places units largest first, and returns a PlacementSolution.
+
+    Units of the same charm always go on different machines.
+    Exclusive units take the smallest free machine that satisfies
+    them. Shared units go on a machine already hosting shared units if
+    one has room:
+
+    FIRST_FIT_DECREASING - the first such machine, in the order they
+    were taken
+
+    BEST_FIT_DECREASING - the one with the least room left after
+    placing the unit
+
+    otherwise on the largest free machine, which fits the most units
+    alongside it. Once all units are placed, each shared machine's
+    units are moved to the smallest free machine that holds them all,
+    see _shrink(), so the largest machines are the ones left free.
+
+    order - unit indexes to place, in order, default unit_order()
+    """
+    if strategy not in (FIRST_FIT_DECREASING, BEST_FIT_DECREASING):
+        raise ValueError("Unknown packing strategy {}".format(strategy))
+    if order is None:
+        order = problem.unit_order()
+
+    free_mask = (1 << len(problem.machine_ids)) - 1
+    shared = []
+    remaining = {}
+    used_by = defaultdict(int)
+    machine_of = [None] * len(problem.units)
+
+    for u in order:
+        unit = problem.units[u]
+        allowed = unit.feasible & ~used_by[unit.charm_name]
+        for other in unit.conflicts:
+            allowed &= ~used_by[other]
+        m = None
+
+        if not unit.exclusive:
+            best = None
+            for i in shared:
+                if not allowed >> i & 1 or \
+                   not _fits(unit.demand, remaining[i]):
+                    continue
+                if strategy == FIRST_FIT_DECREASING:
+                    m = i
+                    break
+                left = sum(f - d for f, d in zip(remaining[i], unit.demand))
+                if best is None or left < best:
+                    m, best = i, left
+
+        if m is None:
+            candidates = allowed & free_mask
+            while candidates:
+                if unit.exclusive:
+                    # smallest:
+                    bit = candidates & -candidates
+                else:
+                    # largest:
+                    bit = 1 << (candidates.bit_length() - 1)
+                i = bit.bit_length() - 1
+                if unit.exclusive or _fits(unit.demand,
+                                           problem.capacity[i]):
+                    m = i
+                    break
+                candidates ^= bit
+            if m is None:
+                continue
+            free_mask &= ~(1 << m)
+            if not unit.exclusive:
+                shared.append(m)
+                remaining[m] = problem.capacity[m]
+
+        if not unit.exclusive:
+            remaining[m] = tuple(f - d for f, d in zip(remaining[m],
+                                                       unit.demand))
+        used_by[unit.charm_name] |= 1 << m
+        machine_of[u] = m
+
+    _shrink(problem, machine_of, free_mask)
+    return PlacementSolution(problem, machine_of)
+
+
+def _ruin(solution, order, rng):
+    """Returns a new unit order with the units on a few lightly loaded
+    machines moved to the front, so the next pack() places them first
+    and may fit them elsewhere, emptying those machines.
+    """
+    units_on = defaultdict(list)
+    for u, m in enumerate(solution.machine_of):
+        units_on[m].append(u)
+    machines = sorted(units_on, key=lambda m: (m is not None,
+                                               len(units_on[m]),
+                                               rng.random()))
+    n = rng.randint(1, max(1, min(4, len(machines))))
+    first = [u for m in machines[:n] for u in units_on[m]]
+    moved = set(first)
+    return first + [u for u in order if u not in moved]
+
+
+def search(problem, budget=DEFAULT_BUDGET, seed=None):
+    """Improves on the heuristics by local search, and returns the best
+    PlacementSolution found within budget seconds.
+
+    Starts from the better of FIRST_FIT_DECREASING and
+    BEST_FIT_DECREASING. Each step moves the units of a few lightly
+    loaded machines to the front of the order and packs again, keeping
+    the result if it is no worse. After RESTART_AFTER steps without
+    improving, starts over from a jittered decreasing order.
+
+    Stops early if a solution reaches problem.lower_bound() with only
+    the units in problem.min_unplaced() left unplaced, or after
+    GIVE_UP_AFTER steps without a better solution.
+    """
+    rng = random.Random(seed)
+    deadline = time.monotonic() + budget
+    order = problem.unit_order()
+    best = current = min([pack(problem, s, order) for s in
+                          (FIRST_FIT_DECREASING, BEST_FIT_DECREASING)],
+                         key=PlacementSolution.score)
+    current_order = order
+    target = (problem.min_unplaced(), problem.lower_bound())
+    stale = 0
+    since_best = 0
+    steps = 0
+
+    while time.monotonic() < deadline and best.score()[:2] > target and \
+            since_best < GIVE_UP_AFTER:
+        steps += 1
+        since_best += 1
+        if stale >= RESTART_AFTER:
+            order = problem.unit_order(rng)
+            current, current_order = pack(problem, BEST_FIT_DECREASING,
+                                          order), order
+            stale = 0
+        else:
+            order = _ruin(current, current_order, rng)
+            solution = pack(problem, BEST_FIT_DECREASING, order)
+            if solution.score() < current.score():
+                stale = 0
+            else:
+                stale += 1
+            if solution.score() <= current.score():
+                current, current_order = solution, order
+        if current.score() < best.score():
+            best = current
+            since_best = 0
+
+    log.debug("search: {} steps, best {}".format(steps, best))
+    return best
+
+
+def _search_worker(problem, budget, seed):
+    "Runs search() in a worker process, returning just the placement"
+    return search(problem, budget, seed).machine_of
+
+
+def parallel_search(problem, budget=DEFAULT_BUDGET, workers=None):
+    """Runs one search() per worker process, each with its own seed, and
+    returns the best solution found by any of them.
+
+    workers defaults to cpu_count(). If there is only one, or the
+    process pool can't be used, searches in this process instead.
+
+    Workers are spawned rather than forked: callers hold the controller
+    lock and other threads, e.g. the autosave writer, may hold locks
+    too, which a forked child would inherit locked.
+    """
+    if workers is None:
+        workers = cpu_count()
+    if workers <= 1:
+        return search(problem, budget, seed=0)
+
+    try:
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_search_worker, problem, budget, seed)
+                       for seed in range(workers)]
+            solutions = [PlacementSolution(problem, f.result())
+                         for f in futures]
+    except (OSError, RuntimeError) as e:
+        log.warning("Parallel placement search failed, searching in "
+                    "one process: {}".format(e))
+        return search(problem, budget, seed=0)
+
+    return min(solutions, key=PlacementSolution.score)
+
+
+def solve(problem, strategy=DEFAULT_STRATEGY, budget=DEFAULT_BUDGET,
+          workers=None):
+    """Returns a PlacementSolution for problem using strategy.
+
+    LOCAL_SEARCH runs on workers processes, see parallel_search().
+    """
+    if strategy == LOCAL_SEARCH:
+        return parallel_search(problem, budget, workers)
+    return pack(problem, strategy)
+
+
+def autoplace(charm_classes, machines, strategy=DEFAULT_STRATEGY,
+              budget=DEFAULT_BUDGET, workers=None, counts=None):
+    """Returns {instance_id: {atype: [charm class]}} placing the units of
+    charm_classes on machines, see PlacementProblem and solve()."""
+    start = time.time()
+    problem = PlacementProblem.from_charms(charm_classes, machines, counts)
+    solution = solve(problem, strategy, budget, workers)
+    log.debug("autoplace ({}): {} units on {} of {} machines, {} unplaced, "
+              "{:.3f}s".format(strategy, len(problem.units),
+                               solution.machines_used(),
+                               len(problem.machine_ids),
+                               len(solution.unplaced()),
+                               time.time() - start))
+    return solution.assignments(charm_classes)
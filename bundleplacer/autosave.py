@@ -0,0 +1,122 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import logging
+import threading
+import time
+
+log = logging.getLogger('bundleplacer')
+
+
+# seconds without changes before autosaving:
+DEFAULT_AUTOSAVE_DELAY = 0.5
+# a stream of changes is still saved at least this often:
+DEFAULT_AUTOSAVE_MAX_DELAY = 5.0
+
+
+class AutosaveWriter:
+    """Calls save() from a background thread when asked to.
+
+    schedule() only records that a save is wanted and returns at once.
+    The thread saves when there have been no further requests for
+    delay seconds, or max_delay seconds after the first unsaved
+    request, so any number of changes in a burst costs one save.
+
+    save is called from the writer thread and must take whatever
+    locks it needs to see consistent state, see
+    filecache.write_atomic() for writing the file. flush() saves
+    pending changes immediately, close() flushes and stops the
+    thread, and is also run at interpreter exit.
+    """
+
+    def __init__(self, save, delay=DEFAULT_AUTOSAVE_DELAY,
+                 max_delay=DEFAULT_AUTOSAVE_MAX_DELAY):
+        self.save = save
+        self.delay = delay
+        self.max_delay = max_delay
+        self.writes = 0
+        # guards the fields below, and wakes the writer thread:
+        self._cond = threading.Condition(threading.RLock())
+        # held while saving, so flush() and the thread never save at
+        # the same time:
+        self._write_lock = threading.RLock()
+        self._dirty = False
+        self._first_request = None
+        self._last_request = None
+        self._closed = False
+        self._thread = None
+        atexit.register(self.close)
+
+    def schedule(self):
+        """Asks for a save soon."""
+        with self._cond:
+            if self._closed:
+                return
+            now = time.monotonic()
+            if not self._dirty:
+                self._dirty = True
+                self._first_request = now
+            self._last_request = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='autosave',
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _due_in(self):
+        "Seconds until a save is due, <= 0 if it is due now"
+        now = time.monotonic()
+        return min(self._last_request + self.delay,
+                   self._first_request + self.max_delay) - now
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                remaining = self._due_in()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()
+
+    def flush(self):
+        """Writes pending changes now, in the calling thread."""
+        with self._write_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                # requests made while writing mark it dirty again:
+                self._dirty = False
+            try:
+                self.save()
+                self.writes += 1
+            except Exception:
+                log.exception("Autosave failed")
+
+    def close(self):
+        """Writes pending changes and stops the writer thread."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        atexit.unregister(self.close)
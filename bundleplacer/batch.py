@@ -0,0 +1,119 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Headless placement, for running in scripts and CI
+
+    bundle-placer place bundle.yaml --machines nodes.json -o placement.yaml
+
+Loads the bundle, auto-places every required service onto the machines
+in a MAAS nodes JSON file, and writes the placement in the format read
+by PlacementController.load(). Exits non-zero if the result can't be
+deployed. Doesn't import urwid or ubuntui.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from bundleplacer import timing
+from bundleplacer.autoplacer import (DEFAULT_BUDGET, DEFAULT_STRATEGY,
+                                     STRATEGIES)
+from bundleplacer.bundle import CharmStoreAPI
+from bundleplacer.charmcache import DEFAULT_TTL
+from bundleplacer.config import Config
+from bundleplacer.controller import PlacementController
+from bundleplacer.fixtures.maas import FakeMaasState
+
+log = logging.getLogger('bundleplacer')
+
+
+def parse_options(argv):
+    parser = argparse.ArgumentParser(description='Place a bundle without '
+                                     'the UI',
+                                     prog='bundle-placer place',
+                                     argument_default=argparse.SUPPRESS)
+    parser.add_argument("bundle_filename", metavar='bundle',
+                        help="Bundle file to place")
+    parser.add_argument("--metadata", dest="metadata_filename",
+                        metavar='metadatafile',
+                        help="Optional metadata file describing constraints "
+                        "on services in bundle")
+    parser.add_argument("--machines", dest="machines_filename",
+                        metavar='nodesfile', default=None,
+                        help="JSON list of MAAS nodes to place on, as "
+                        "returned by the MAAS API. Defaults to the "
+                        "maas-machines.json sample")
+    parser.add_argument("-o", "--output", dest="output_filename",
+                        metavar='file', default='-',
+                        help="Where to write the placement, default stdout")
+    parser.add_argument("--offline", dest="offline", action='store_true',
+                        default=False,
+                        help="Don't contact the charm store, use only "
+                        "cached charm metadata")
+    parser.add_argument("--charm-cache-ttl", dest="charm_cache_ttl",
+                        type=int, default=DEFAULT_TTL, metavar='SECONDS',
+                        help="How long cached charm metadata is "
+                        "considered fresh")
+    parser.add_argument("--autoplace-strategy", dest="autoplace_strategy",
+                        choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help="How services are packed onto machines")
+    parser.add_argument("--autoplace-budget", dest="autoplace_budget",
+                        type=float, default=DEFAULT_BUDGET,
+                        metavar='SECONDS',
+                        help="Time the search strategy may take")
+    parser.add_argument("--timings", dest="timings", action='store_true',
+                        default=False,
+                        help="Print a breakdown of startup time to stderr")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Runs headless placement, returns the exit status."""
+    opts = parse_options(argv)
+    if opts.machines_filename is not None and \
+       not os.path.exists(opts.machines_filename):
+        print("Machines file {} not found".format(opts.machines_filename),
+              file=sys.stderr)
+        return 2
+
+    config = Config('bundle-placer', opts.__dict__)
+
+    CharmStoreAPI.configure(cache_path=config.charm_cache_path,
+                            ttl=config.getopt('charm_cache_ttl'),
+                            offline=config.getopt('offline'))
+
+    maas_state = FakeMaasState(opts.machines_filename)
+    placement_controller = PlacementController(config=config,
+                                               maas_state=maas_state)
+
+    with timing.phase('placement'):
+        ok, msg = placement_controller.autoassign_unassigned_services()
+
+    if opts.output_filename == '-':
+        placement_controller.save(sys.stdout)
+    else:
+        with open(opts.output_filename, 'w') as f:
+            placement_controller.save(f)
+
+    if opts.timings:
+        print(timing.report(), file=sys.stderr)
+
+    if not ok or not placement_controller.can_deploy():
+        print(msg or "Placement is incomplete, the bundle can't be "
+              "deployed.", file=sys.stderr)
+        return 1
+    print(msg, file=sys.stderr)
+    return 0
@@ -13,31 +13,118 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from theblues.charmstore import CharmStore
-import yaml
+import os
 
+from bundleplacer import timing, yamlio
+from bundleplacer.bundlecache import ParsedBundleCache, content_key
 from bundleplacer.charm import Charm
+from bundleplacer.charmcache import (CharmMetadataCache, DEFAULT_TTL,
+                                     DEFAULT_MAX_ENTRIES)
 from bundleplacer.assignmenttype import AssignmentType, label_to_atype
 
 log = logging.getLogger('bundleplacer')
 
-from functools import lru_cache
+
+PREFETCH_MAX_WORKERS = 8
+
+
+def charm_name_from_service(service_dict):
+    """Returns the charm store name for a bundle service entry, e.g.
+    'hdp-hadoop' for 'cs:trusty/hdp-hadoop-8'.
+    """
+    charm_name = service_dict['charm'].split('/')[-1]
+    return '-'.join(charm_name.split('-')[:-1])
 
 
 class CharmStoreAPI:
+    """Looks up charm store entities, memoized in process and optionally
+    in a persistent on-disk cache set up with configure().
+
+    In offline mode the charm store is never contacted, and lookups
+    that miss the cache return None.
+    """
     _charmstore = None
+    _cache = None
+    _entities = {}
+    offline = False
 
-    def __init__(self):
-        if not CharmStoreAPI._charmstore:
-            CharmStoreAPI._charmstore = CharmStore('https://api.jujucharms.com/v4')
+    @classmethod
+    def configure(cls, cache_path=None, ttl=DEFAULT_TTL,
+                  max_entries=DEFAULT_MAX_ENTRIES, offline=False):
+        if cache_path:
+            cls._cache = CharmMetadataCache(cache_path, ttl=ttl,
+                                            max_entries=max_entries)
+        else:
+            cls._cache = None
+        cls.offline = offline
+        cls._entities = {}
+
+    @classmethod
+    def _get_charmstore(cls):
+        if not cls._charmstore:
+            # imported here so offline and fully cached runs don't pay
+            # for the HTTP stack:
+            from theblues.charmstore import CharmStore
+            cls._charmstore = CharmStore('https://api.jujucharms.com/v4')
+        return cls._charmstore
 
     @classmethod
-    @lru_cache(maxsize=128)
-    def lookup_charm(self, charm_name):
-        entity = CharmStoreAPI._charmstore.entity(charm_name)
+    def lookup_charm(cls, charm_name):
+        if charm_name in cls._entities:
+            return cls._entities[charm_name]
+
+        entity = None
+        if cls._cache:
+            entity = cls._cache.get(charm_name, allow_stale=cls.offline)
+
+        if entity is None and not cls.offline:
+            try:
+                entity = cls._get_charmstore().entity(charm_name)
+            except Exception as e:
+                if not cls._cache:
+                    raise
+                log.warning("Charm store lookup of {} failed, trying stale "
+                            "cache entry: {}".format(charm_name, e))
+                entity = cls._cache.get(charm_name, allow_stale=True)
+                if entity is None:
+                    raise
+            else:
+                if cls._cache:
+                    cls._cache.put(charm_name, entity)
+
+        if entity is None:
+            log.warning("No cached metadata for charm {} "
+                        "in offline mode".format(charm_name))
+        cls._entities[charm_name] = entity
         return entity
 
+    @classmethod
+    def prefetch(cls, charm_names, max_workers=PREFETCH_MAX_WORKERS):
+        """Looks up all of charm_names concurrently, so that later calls to
+        lookup_charm are served from memory.
+
+        Duplicate names are only looked up once. Failures are logged
+        and left for lookup_charm to report.
+        """
+        todo = set(charm_names) - set(cls._entities)
+        if len(todo) == 0:
+            return
+        if len(todo) == 1 or max_workers <= 1:
+            return
+
+        def lookup(charm_name):
+            try:
+                cls.lookup_charm(charm_name)
+            except Exception as e:
+                log.warning("Prefetching charm {} failed: {}".format(
+                    charm_name, e))
+
+        with ThreadPoolExecutor(max_workers=min(max_workers,
+                                                len(todo))) as executor:
+            list(executor.map(lookup, sorted(todo)))
+
 
 def create_charm_class(servicename, service_dict, servicemeta):
     # some attempts to guess at subordinate status from bundle format,
@@ -50,11 +137,15 @@ def create_charm_class(servicename, service_dict, servicemeta):
 
     is_subordinate = service_dict['num_units'] == 0
 
-    charm_name = service_dict['charm'].split('/')[-1]
-    charm_name = '-'.join(charm_name.split('-')[:-1])
-    entity = CharmStoreAPI().lookup_charm(charm_name)
-    display_name = "{} ({})".format(servicename, entity['Meta']['charm-metadata']['Name'])
-    summary = entity['Meta']['charm-metadata']['Summary']
+    charm_name = charm_name_from_service(service_dict)
+    entity = CharmStoreAPI.lookup_charm(charm_name)
+    if entity is None:
+        display_name = "{} ({})".format(servicename, charm_name)
+        summary = ""
+    else:
+        charm_metadata = entity['Meta']['charm-metadata']
+        display_name = "{} ({})".format(servicename, charm_metadata['Name'])
+        summary = charm_metadata['Summary']
 
     charm = Charm(charm_name=servicename,
                   display_name=servicemeta.get('display-name', display_name),
@@ -68,7 +159,11 @@ def create_charm_class(servicename, service_dict, servicemeta):
                   num_units=service_dict.get('num_units', 1),
                   allow_multi_units=servicemeta.get('allow_multi_units', True),
                   subordinate=is_subordinate,
-                  required=servicemeta.get('required', True))
+                  required=servicemeta.get('required', True),
+                  # units share machines unless the metadata says the
+                  # charm needs a machine to itself:
+                  isolate=(servicemeta.get('isolate', False) and
+                           not is_subordinate))
 
     # Make sure to map any strings to an assignment type enum
     if any(isinstance(atype, str) for atype in charm.allowed_assignment_types):
@@ -78,20 +173,119 @@ def create_charm_class(servicename, service_dict, servicemeta):
 
 
 class Bundle:
-    def __init__(self, filename, metadatafilename):
+    """Parsed bundle and metadata files.
+
+    Charm classes are built once per revision of the bundle and
+    metadata files and handed back as the same objects on every
+    access. The files are re-read only when their mtime or size
+    changes, and charms that are unchanged by a reload keep their
+    identity.
+
+    cache_path - optional directory for a ParsedBundleCache. Files whose
+    contents have been parsed before are then loaded from the cache
+    instead of parsing the YAML again.
+    """
+
+    def __init__(self, filename, metadatafilename, cache_path=None):
         self.filename = filename
         self.metadatafilename = metadatafilename
-        with open(self.filename) as f:
-            self._bundle = yaml.load(f)
-        with open(self.metadatafilename) as f:
-            self._metadata = yaml.load(f)
+        if cache_path:
+            self._cache = ParsedBundleCache(cache_path)
+        else:
+            self._cache = None
+        self.revision = 0
+        self._file_key = None
+        self._charm_classes = None
+        self._charm_classes_by_name = {}
+        self._load()
 
-    @property
-    def charm_classes(self):
+    def _stat_key(self):
+        key = []
+        for fn in [self.filename, self.metadatafilename]:
+            if not fn:
+                continue
+            st = os.stat(fn)
+            key.append((st.st_mtime_ns, st.st_size))
+        return tuple(key)
+
+    def _load(self):
+        self._file_key = self._stat_key()
+        with timing.phase('bundle parse'):
+            with open(self.filename, 'rb') as f:
+                bundle_text = f.read()
+            # the metadata file is optional, and its option is False
+            # when not given:
+            if self.metadatafilename:
+                with open(self.metadatafilename, 'rb') as f:
+                    metadata_text = f.read()
+            else:
+                metadata_text = b''
+
+            key = content_key(bundle_text, metadata_text)
+            cached = self._cache.get(key) if self._cache else None
+            if cached is not None:
+                self._bundle, self._metadata = cached
+            else:
+                self._bundle = yamlio.load(bundle_text)
+                self._metadata = yamlio.load(metadata_text) or {}
+                if self._cache:
+                    self._cache.put(key, (self._bundle, self._metadata))
+        self._charm_classes = None
+        self.revision += 1
+
+    def refresh(self):
+        """Re-reads the bundle and metadata files if either has changed on
+        disk since it was last read.
+
+        Returns True if the files were reloaded.
+        """
+        try:
+            key = self._stat_key()
+        except OSError as e:
+            log.debug("Can't stat bundle files, keeping cached copy: "
+                      "{}".format(e))
+            return False
+        if key == self._file_key:
+            return False
+        log.debug("Bundle files changed, reloading {}".format(self.filename))
+        self._load()
+        return True
+
+    def _build_charm_classes(self):
         charm_classes = []
+        by_name = {}
         metadata = self._metadata.get('services', {})
         services = self._bundle.get('services', {})
+        CharmStoreAPI.prefetch([charm_name_from_service(sd)
+                                for sd in services.values()])
         for servicename, sd in services.items():
             sm = metadata.get(servicename, {})
-            charm_classes.append(create_charm_class(servicename, sd, sm))
-        return charm_classes
+            cc = create_charm_class(servicename, sd, sm)
+            # keep identity of charms that a reload didn't change:
+            prev = self._charm_classes_by_name.get(servicename)
+            if prev is not None and prev == cc:
+                cc = prev
+            charm_classes.append(cc)
+            by_name[servicename] = cc
+        self._charm_classes = charm_classes
+        self._charm_classes_by_name = by_name
+
+    def _ensure_charm_classes(self):
+        self.refresh()
+        if self._charm_classes is None:
+            with timing.phase('charm resolution'):
+                self._build_charm_classes()
+
+    @property
+    def charm_classes(self):
+        """List of Charm objects for the current revision of the bundle.
+
+        The returned list is shared, do not modify it.
+        """
+        self._ensure_charm_classes()
+        return self._charm_classes
+
+    def charm_class(self, charm_name):
+        """Returns the Charm with the given name, or None."""
+        self._ensure_charm_classes()
+        return self._charm_classes_by_name.get(charm_name)
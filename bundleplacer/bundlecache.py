@@ -0,0 +1,80 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import pickle
+
+from bundleplacer.filecache import FileCache
+
+log = logging.getLogger('bundleplacer')
+
+
+# bump when the cached data changes shape, older entries are ignored:
+CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 32
+
+
+def content_key(*contents):
+    """Returns the cache key, a hex string, for the given file contents
+    as bytes."""
+    h = hashlib.sha256()
+    for c in contents:
+        h.update(hashlib.sha256(c).digest())
+    return h.hexdigest()
+
+
+class ParsedBundleCache(FileCache):
+    """Cache of parsed bundle and metadata files, one pickle per content
+    hash, so that unchanged files don't have to be parsed again.
+
+    path - directory to keep the cache in, created if needed
+
+    max_entries - when exceeded, the least recently used entries are
+    removed.
+
+    Anything wrong with an entry (unreadable, truncated, written by
+    another version, or for different content) makes get() return
+    None, and the caller parses the files as usual.
+    """
+
+    SUFFIX = '.pickle'
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def get(self, key):
+        fn = self._filename(key)
+        try:
+            with open(fn, 'rb') as f:
+                version, stored_key, data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.debug("Ignoring unreadable bundle cache entry {}: "
+                      "{}".format(fn, e))
+            return None
+        if version != CACHE_VERSION or stored_key != key:
+            log.debug("Ignoring stale bundle cache entry {}".format(fn))
+            return None
+        self.touch(key)
+        return data
+
+    def put(self, key, data):
+        try:
+            self.store(key, pickle.dumps((CACHE_VERSION, key, data),
+                                         protocol=pickle.HIGHEST_PROTOCOL))
+        except (OSError, pickle.PicklingError) as e:
+            log.warning("Unable to cache parsed bundle: {}".format(e))
@@ -17,7 +17,8 @@
 class Charm:
     def __init__(self, charm_name, display_name, summary, constraints,
                  depends, conflicts, allowed_assignment_types,
-                 num_units, allow_multi_units, subordinate, required):
+                 num_units, allow_multi_units, subordinate, required,
+                 isolate=False):
         self.charm_name = charm_name
         self.display_name = display_name
         self.summary = summary
@@ -29,7 +30,7 @@ class Charm:
         self.allow_multi_units = allow_multi_units
         self.subordinate = subordinate
         self.is_core = required
-        self.isolate = True
+        self.isolate = isolate
 
     def required_num_units(self):
         return self.num_units
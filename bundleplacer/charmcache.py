@@ -0,0 +1,70 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import time
+
+from bundleplacer.filecache import FileCache
+
+log = logging.getLogger('bundleplacer')
+
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class CharmMetadataCache(FileCache):
+    """Persistent cache of charm store entities, one JSON file per charm id.
+
+    path - directory to keep the cache in, created if needed
+
+    ttl - seconds an entry stays fresh. Stale entries are only
+    returned when explicitly asked for, e.g. in offline mode or when
+    the charm store can't be reached.
+
+    max_entries - when exceeded, the least recently used entries are
+    removed.
+    """
+
+    SUFFIX = '.json'
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+        self.ttl = ttl
+
+    def get(self, charm_id, allow_stale=False):
+        """Returns the cached entity for charm_id, or None if it is missing,
+        unreadable, or older than ttl and allow_stale is False.
+        """
+        try:
+            with open(self._filename(charm_id)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        age = time.time() - entry.get('fetched', 0)
+        if age > self.ttl and not allow_stale:
+            return None
+        self.touch(charm_id)
+        return entry.get('entity')
+
+    def put(self, charm_id, entity):
+        """Stores entity for charm_id, evicting old entries if needed."""
+        try:
+            self.store(charm_id, json.dumps({'fetched': time.time(),
+                                             'entity': entity}))
+        except (OSError, TypeError, ValueError) as e:
+            log.warning("Unable to cache charm {}: {}".format(charm_id, e))
@@ -0,0 +1,68 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class CharmGraph:
+
+    """Dependency and conflict relations between the charms of a bundle.
+
+    Built once per bundle revision from each charm's 'depends' and
+    'conflicts' metadata. Only charms in the bundle appear in the
+    graph, names that don't match a charm are ignored.
+
+    conflicts - {charm_name: set of conflicting charm names}, symmetric
+
+    dependencies - {charm_name: set of names that charm depends on}
+
+    dependents - {charm_name: set of names that depend on that charm}
+    """
+
+    def __init__(self, charm_classes):
+        self.charms = {cc.charm_name: cc for cc in charm_classes}
+        self.conflicts = {name: set() for name in self.charms}
+        self.dependencies = {name: set() for name in self.charms}
+        self.dependents = {name: set() for name in self.charms}
+
+        for name, cc in self.charms.items():
+            for other in cc.conflicts:
+                if other in self.charms:
+                    self.conflicts[name].add(other)
+                    self.conflicts[other].add(name)
+            for other in cc.depends:
+                if other in self.charms:
+                    self.dependencies[name].add(other)
+                    self.dependents[other].add(name)
+
+        self.required = set(name for name, cc in self.charms.items()
+                            if cc.is_core)
+
+    def __repr__(self):
+        return "<CharmGraph {} charms>".format(len(self.charms))
+
+    def affected_by(self, charm_class):
+        """Returns the names of charms whose state may change when
+        charm_class is placed or unplaced: itself, the charms it
+        conflicts with and the charms it depends on.
+        """
+        name = charm_class.charm_name
+        if name not in self.charms:
+            return set([name])
+        return (set([name]) | self.conflicts[name] |
+                self.dependencies[name])
+
+    def charm_dependencies(self, charm_class):
+        """Returns the charm classes that charm_class depends on."""
+        return [self.charms[n] for n in
+                self.dependencies.get(charm_class.charm_name, ())]
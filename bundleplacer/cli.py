@@ -15,22 +15,15 @@
 
 import argparse
 import logging
-import os
 import sys
-import urwid
 
-lib_dir = os.path.abspath('/usr/share/openstack')
-sys.path.insert(0, lib_dir)
+from bundleplacer import timing
+from bundleplacer.autoplacer import (DEFAULT_BUDGET, DEFAULT_STRATEGY,
+                                     STRATEGIES)
+from bundleplacer.charmcache import DEFAULT_TTL
 
-from cloudinstall.maas import connect_to_maas
-
-from bundleplacer.config import Config
-from bundleplacer.controller import PlacementController
-from bundleplacer.log import setup_logger
-from bundleplacer.placerview import PlacerView, PlacerUI
-from bundleplacer.fixtures.maas import FakeMaasState
-from ubuntui.ev import EventLoop
-from ubuntui.palette import STYLES
+# Everything else is imported in main(), after the options are parsed,
+# so that --help and 'place' don't load the UI.
 
 log = None
 
@@ -38,6 +31,8 @@ log = None
 def parse_options(argv):
     parser = argparse.ArgumentParser(description='Juju Bundle Placer',
                                      prog='placer',
+                                     epilog="Run 'placer place --help' "
+                                     "for placing bundles without the UI",
                                      argument_default=argparse.SUPPRESS)
     parser.add_argument("bundle_filename", metavar='bundle',
                         help="Bundle file to edit")
@@ -47,12 +42,49 @@ def parse_options(argv):
                         "on services in bundle")
     parser.add_argument("--maas-ip", dest="maas_ip", default=None)
     parser.add_argument("--maas-cred", dest="maas_cred", default=None)
+    parser.add_argument("--offline", dest="offline", action='store_true',
+                        default=False,
+                        help="Don't contact the charm store, use only "
+                        "cached charm metadata")
+    parser.add_argument("--charm-cache-ttl", dest="charm_cache_ttl",
+                        type=int, default=DEFAULT_TTL, metavar='SECONDS',
+                        help="How long cached charm metadata is "
+                        "considered fresh")
+    parser.add_argument("--autoplace-strategy", dest="autoplace_strategy",
+                        choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help="How Auto-place packs services onto machines: "
+                        "first-fit or best-fit decreasing, or a local "
+                        "search for fewer machines")
+    parser.add_argument("--autoplace-budget", dest="autoplace_budget",
+                        type=float, default=DEFAULT_BUDGET,
+                        metavar='SECONDS',
+                        help="Time the search strategy may take")
+    parser.add_argument("--timings", dest="timings", action='store_true',
+                        default=False,
+                        help="Print a breakdown of startup time on exit")
     return parser.parse_args(argv)
 
 
 def main():
+    if sys.argv[1:2] == ['place']:
+        with timing.phase('import'):
+            from bundleplacer import batch
+        sys.exit(batch.main(sys.argv[2:]))
+
     opts = parse_options(sys.argv[1:])
 
+    with timing.phase('import'):
+        import urwid
+        from ubuntui.ev import EventLoop
+        from ubuntui.palette import STYLES
+
+        from bundleplacer.bundle import CharmStoreAPI
+        from bundleplacer.config import Config
+        from bundleplacer.controller import PlacementController
+        from bundleplacer.fixtures.maas import FakeMaasState
+        from bundleplacer.log import setup_logger
+        from bundleplacer.placerview import PlacerView, PlacerUI
+
     config = Config('bundle-placer', opts.__dict__)
     config.save()
 
@@ -62,7 +94,12 @@ def main():
 
     log.info("Editing file: {}".format(opts.bundle_filename))
 
+    CharmStoreAPI.configure(cache_path=config.charm_cache_path,
+                            ttl=config.getopt('charm_cache_ttl'),
+                            offline=config.getopt('offline'))
+
     if opts.maas_ip and opts.maas_cred:
+        from cloudinstall.maas import connect_to_maas
         creds = dict(api_host=opts.maas_ip,
                      api_key=opts.maas_cred)
         maas, maas_state = connect_to_maas(creds)
@@ -81,4 +118,9 @@ def main():
     EventLoop.build_loop(ui, STYLES, unhandled_input=unhandled_input)
     mainview.loop = EventLoop.loop
     mainview.update()
+    startup_timings = timing.report()
+    log.info("Startup timings:\n" + startup_timings)
     EventLoop.run()
+    placement_controller.flush_autosave()
+    if opts.timings:
+        print(startup_timings, file=sys.stderr)
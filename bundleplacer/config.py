@@ -19,7 +19,8 @@ from collections import defaultdict
 import datetime
 import logging
 import os
-import yaml
+
+from bundleplacer import yamlio
 
 
 log = logging.getLogger('bundleplacer')
@@ -51,8 +52,7 @@ class Config:
                 os.makedirs(backup_path, exist_ok=True)
                 os.rename(self.cfg_file, backupfilename)
             with open(self.cfg_file, 'w') as f:
-                f.write(yaml.safe_dump(dict(self._config),
-                                       default_flow_style=False))
+                yamlio.dump(self._config, f, default_flow_style=False)
         except IOError as e:
             raise ConfigException("Unable to save configuration: {}".format(e))
 
@@ -71,6 +71,16 @@ class Config:
     def cfg_file(self):
         return os.path.join(self.cfg_path, 'config.yaml')
 
+    @property
+    def charm_cache_path(self):
+        """ persistent charm store metadata cache """
+        return os.path.join(self.cfg_path, 'charmstore-cache')
+
+    @property
+    def bundle_cache_path(self):
+        """ cache of parsed bundle and metadata files """
+        return os.path.join(self.cfg_path, 'bundle-cache')
+
     @classmethod
     def share_path(cls):
         """ Application share path
@@ -14,23 +14,49 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections import defaultdict, Counter
-import copy
 # from enum import Enum
+import functools
 import logging
-import yaml
+import os
 from multiprocessing import cpu_count
+import threading
 
 from cloudinstall.maas import (satisfies, MaasMachineStatus)
 from cloudinstall.state import CharmState
 
+from bundleplacer.autoplacer import (autoplace, DEFAULT_BUDGET,
+                                     DEFAULT_STRATEGY)
 from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.autosave import AutosaveWriter
 from bundleplacer.bundle import Bundle
+from bundleplacer.charmgraph import CharmGraph
+from bundleplacer.machine import PlacementMachine
+from bundleplacer.machinetable import MachineTable
+from bundleplacer.inventory import MachineInventory, machine_fingerprint
+from bundleplacer import journal
+from bundleplacer.journal import PlacementJournal
+from bundleplacer.placementstore import PlacementStore
+from bundleplacer import yamlio
 
 log = logging.getLogger('bundleplacer')
 
 
 DEFAULT_SHARED_ASSIGNMENT_TYPE = AssignmentType.LXC
 
+# Set to recompute assigned/deployed services from scratch after every
+# change and log any difference from the incrementally maintained sets:
+CHECK_CONSISTENCY = os.environ.get('PLACEMENT_CHECK_CONSISTENCY') is not None
+
+
+def _locked(method):
+    """Runs a PlacementController method holding its lock, so the
+    autosave thread never sees placements half-changed."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class PlaceholderMachine:
 
@@ -44,6 +70,9 @@ class PlaceholderMachine:
     expecting MAAS machines.
     """
 
+    __slots__ = ('instance_id', 'system_id', 'machine_id', 'display_name',
+                 'constraints')
+
     def __init__(self, instance_id, name, constraints=None):
         self.instance_id = instance_id
         self.system_id = instance_id
@@ -113,18 +142,46 @@ class PlacementController:
     def __init__(self, maas_state=None, config=None):
         self.config = config
         self.maas_state = maas_state
+        # guards assignments and deployments, see _locked:
+        self._lock = threading.RLock()
         self._machines = []
         self.sub_placeholder = PlaceholderMachine('_subordinates',
                                                   'Subordinate Charms')
         self.def_placeholder = PlaceholderMachine('_default',
                                                   'Juju Default')
-        # assignments is {id: {atype: [charm class]}}
-        self.assignments = defaultdict(lambda: defaultdict(list))
-        self.deployments = defaultdict(lambda: defaultdict(list))
+        # new snapshots are only taken by invalidate_nodes_cache() and
+        # _snapshot_machines(), so that everything done between two
+        # polls, e.g. a redraw, sees the same machines:
+        self.inventory = MachineInventory(self._inventory_source,
+                                          ttl=None,
+                                          convert=self._convert_machine,
+                                          fingerprint=self._fingerprint)
+        # machine lists and {instance_id: machine}, rebuilt by
+        # _refresh_machines() when the inventory generation changes:
+        self._indexed_generation = None
+        self._real_machines = []
+        self._all_machines = []
+        self._machines_by_id = {}
+        self._machine_table = None
+        self._snapshot_machines()
+        # assignments is {id: {atype: [charm class]}}, see PlacementStore
+        self.assignments = PlacementStore()
+        self.deployments = PlacementStore()
         self.autosave_filename = None
+        self._autosave_writer = None
+        self._journal = None
+        # {charm_name: (state, cons, deps)}, see get_charm_state()
+        self._charm_states = {}
+        self._change_listeners = []
         self.bundle = Bundle(config.getopt('bundle_filename'),
-                             config.getopt('metadata_filename'))
+                             config.getopt('metadata_filename'),
+                             cache_path=config.getopt('bundle_cache_path'))
         self.reset_assigned_deployed()
+        # inventory generation and {instance_id: status} that the
+        # assignments were last checked against, see
+        # replace_orphaned_units():
+        self._placed_generation = self.inventory.generation
+        self._placed_statuses = self._machine_statuses()
 
     def get_temp_copy(self):
         """Returns another PlacementController that can be used to track
@@ -136,44 +193,87 @@ class PlacementController:
         """
         newpc = PlacementController(maas_state=self.maas_state,
                                     config=self.config)
-        newpc.assignments = copy.copy(self.assignments)
-        newpc.deployments = copy.copy(self.deployments)
+        newpc.assignments = self.assignments.copy()
+        newpc.deployments = self.deployments.copy()
         newpc._machines = self._machines
+        newpc._snapshot_machines()
         newpc.reset_assigned_deployed()
         return newpc
 
+    @_locked
     def update_from_controller(self, other):
         """Updates internal structures based on other's.
         For integrating temporarily tracked updates."""
 
         self.assignments = other.assignments
         self.deployments = other.deployments
+        self._placed_generation = None
         self.reset_assigned_deployed()
 
+    @_locked
     def set_assignments_from_deployments(self):
         """Reset deployment state of all services. Useful after reading a file
         from a previous install.
         """
         self.assignments = self.deployments
-        self.deployments = defaultdict(lambda: defaultdict(list))
+        self.deployments = PlacementStore()
+        self._placed_generation = None
         self.reset_assigned_deployed()
 
     def __repr__(self):
         return "<PlacementController {}>".format(id(self))
 
     def set_autosave_filename(self, filename):
+        if self._autosave_writer is not None:
+            self.flush_autosave()
+            self._autosave_writer.close()
+            self._journal.close()
+            self._autosave_writer = None
+            self._journal = None
         self.autosave_filename = filename
+        if filename:
+            self._journal = PlacementJournal(filename)
+            self._autosave_writer = AutosaveWriter(self._write_autosave)
+
+    def do_autosave(self, record=None):
+        """Saves a change to the autosave file.
+
+        record is the journal record for the change, see
+        bundleplacer.journal. It is appended to the journal right away,
+        and the file itself is rewritten by a background thread only
+        once the journal is long, or for changes without a record.
+        See flush_autosave().
+        """
+        if self._autosave_writer is None:
+            return
+        if record is not None and self._journal.append(record):
+            if self._journal.needs_compaction():
+                self._autosave_writer.schedule()
+            return
+        self._journal.invalidate()
+        self._autosave_writer.schedule()
 
-    def do_autosave(self):
-        if not self.autosave_filename:
+    def flush_autosave(self):
+        """Writes the autosave file, with any journaled changes folded
+        in, now. Call before exiting."""
+        if self._autosave_writer is None:
             return
-        with open(self.autosave_filename, 'w') as af:
-            self.save(af)
+        if self._journal.records > 0:
+            self._autosave_writer.schedule()
+        self._autosave_writer.flush()
+
+    @_locked
+    def _write_autosave(self):
+        self._journal.compact(yamlio.dump(self._flat_placements()))
 
     def save(self, f):
         """f is a file-like object to save state to, to be re-read by
         load(). No guarantees made about the contents of the file.
         """
+        yamlio.dump(self._flat_placements(), f)
+
+    @_locked
+    def _flat_placements(self):
         flat_assignments = defaultdict(dict)
         for iid, ad in self.assignments.items():
 
@@ -194,27 +294,34 @@ class PlacementController:
         for iid in flat_assignments.keys():
             constraints = {}
             if self.maas_state is None:
-                machine = next((m for m in self.machines() if
-                                m.instance_id == iid), None)
+                machine = self.machine_by_id(iid)
                 if machine:
                     constraints = machine.constraints
                     flat_assignments[iid]['constraints'] = constraints
 
-        yaml.dump(flat_assignments, f)
+        return flat_assignments
 
+    @_locked
     def load(self, f):
         """Load assignments from file object written to by save().
         replaces current assignments.
+
+        If f is an autosave file, changes in its journal are replayed
+        on top of it.
         """
         def find_charm_class(name):
-            for cc in self.charm_classes():
-                if cc.charm_name == name:
-                    return cc
+            cc = self.bundle.charm_class(name)
+            if cc is not None:
+                return cc
             log.warning("Could not find charm class "
                         "matching saved charm name {}".format(name))
             return None
 
-        file_assignments = yaml.load(f)
+        text = f.read()
+        if isinstance(text, bytes):
+            # the journal's snapshot digest is of the text:
+            text = text.decode('utf-8')
+        file_assignments = yamlio.load(text) or {}
         new_assignments = defaultdict(lambda: defaultdict(list))
         new_deployments = defaultdict(lambda: defaultdict(list))
         for iid, d in file_assignments.items():
@@ -224,6 +331,7 @@ class PlacementController:
                 pm = PlaceholderMachine(iid, iid,
                                         constraints)
                 self._machines.append(pm)
+                self._snapshot_machines()
 
             ad = d.get('assignments', {})
             for atypestr, al in ad.items():
@@ -241,36 +349,175 @@ class PlacementController:
                 at = AssignmentType.__members__[atypestr]
                 new_deployments[iid][at] = new_dl
 
-        self.assignments.clear()
-        self.assignments.update(new_assignments)
-        self.deployments.clear()
-        self.deployments.update(new_deployments)
+        self.assignments = PlacementStore(new_assignments)
+        self.deployments = PlacementStore(new_deployments)
+
+        filename = getattr(f, 'name', None)
+        if isinstance(filename, str):
+            records = journal.read_journal(filename, text)
+            for r in records:
+                self.assignments, self.deployments = journal.apply_record(
+                    r, self.assignments, self.deployments,
+                    self.bundle.charm_class)
+            if records:
+                log.info("Replayed {} journaled changes from {}".format(
+                    len(records), journal.journal_filename(filename)))
+        self._placed_generation = None
         self.reset_assigned_deployed()
 
-    def update_and_save(self):
-        self.reset_assigned_deployed()
-        self.do_autosave()
+    def add_change_listener(self, listener):
+        """Registers listener to be called after every change to the
+        placements as listener(charm_classes, instance_ids).
+
+        charm_classes is the set of charms whose state may have
+        changed, instance_ids the set of machines whose assignments or
+        deployments changed. Either is None if everything may have
+        changed.
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def _notify_changed(self, charm_classes=None, instance_ids=None):
+        for listener in list(self._change_listeners):
+            listener(charm_classes, instance_ids)
+
+    @_locked
+    def update_and_save(self, charm_classes=None, instance_ids=None,
+                        record=None):
+        """Updates derived state after a change, notifies change listeners
+        and autosaves.
+
+        charm_classes is the list of charms whose placements changed,
+        instance_ids the machines they changed on. If charm_classes is
+        None, everything is recomputed. record is the change's journal
+        record, if it has one.
+        """
+        self._refresh_machines()
+        if charm_classes is None or \
+           self._bundle_revision != self.bundle.revision or \
+           self._counted_generation != self.inventory.generation:
+            self.reset_assigned_deployed()
+        else:
+            affected = self._update_assigned_deployed(charm_classes)
+            if CHECK_CONSISTENCY:
+                self.check_consistency()
+            if instance_ids is not None:
+                instance_ids = set(instance_ids)
+            self._notify_changed(affected, instance_ids)
+        self.do_autosave(record)
 
     def is_placeholder(self, mid):
         return mid in [self.sub_placeholder.instance_id,
                        self.def_placeholder.instance_id]
 
+    def _inventory_source(self):
+        if self.maas_state:
+            cons = self.config.getopt('constraints')
+            return self.maas_state.machines(constraints=cons)
+        else:
+            return self._machines
+
+    def _convert_machine(self, m):
+        if isinstance(m, PlaceholderMachine):
+            return m
+        return PlacementMachine.from_machine(m)
+
+    def _fingerprint(self, m):
+        if isinstance(m, PlaceholderMachine):
+            # placeholder constraints are juju constraints, which often
+            # lack the keys behind arch, mem etc.:
+            return (m.instance_id, m.display_name, dict(m.constraints))
+        return machine_fingerprint(m)
+
+    @property
+    def machines_revision(self):
+        """The generation of the machine inventory, changes whenever the
+        set of machines or their hardware or status changes.
+        """
+        return self.inventory.generation
+
+    def invalidate_nodes_cache(self):
+        """Asks MAAS for the machines again and takes a new inventory
+        snapshot. Until the next call every accessor sees the same
+        machines.
+        """
+        if self.maas_state:
+            self.maas_state.invalidate_nodes_cache()
+        self._snapshot_machines()
+
+    def _snapshot_machines(self):
+        "Takes a new inventory snapshot, e.g. after adding placeholders"
+        self.inventory.invalidate()
+        self.inventory.refresh()
+        self._refresh_machines()
+
+    def _refresh_machines(self):
+        """Rebuilds the machine lists and id index if the inventory has
+        changed since they were last built.
+        """
+        if self.inventory.generation == self._indexed_generation:
+            return
+
+        self._indexed_generation = self.inventory.generation
+        self._real_machines = self.inventory.machines
+        self._all_machines = self._real_machines + [self.sub_placeholder,
+                                                    self.def_placeholder]
+        self._machines_by_id = {m.instance_id: m for m in self._all_machines}
+        self._machine_table = None
+
     def machines(self, include_placeholders=True):
         """Returns all machines known to the controller.
 
         if 'include_placeholder' is False, any placeholder machines
         are excluded.
-        """
-        if self.maas_state:
-            cons = self.config.getopt('constraints')
-            ms = self.maas_state.machines(constraints=cons)
-        else:
-            ms = self._machines
 
+        The returned list is shared, do not modify it.
+        """
+        self._refresh_machines()
         if include_placeholders:
-            return ms + [self.sub_placeholder, self.def_placeholder]
+            return self._all_machines
         else:
-            return ms
+            return self._real_machines
+
+    def machine_by_id(self, instance_id):
+        """Returns the machine (or placeholder) with the given instance id,
+        or None if there isn't one.
+        """
+        self._refresh_machines()
+        return self._machines_by_id.get(instance_id)
+
+    def machine_table(self):
+        """Returns the MachineTable for the current inventory, built on
+        first use after each inventory change. Placeholders aren't
+        included.
+        """
+        self._refresh_machines()
+        if self._machine_table is None:
+            self._machine_table = MachineTable(
+                [m for m in self._real_machines
+                 if not isinstance(m, PlaceholderMachine)],
+                generation=self.inventory.generation)
+        return self._machine_table
+
+    def machine_satisfies(self, machine, constraints):
+        """Returns True if machine meets constraints, same as
+        cloudinstall's satisfies(), using the machine table when
+        machine is part of the current inventory.
+        """
+        if not constraints:
+            return True
+        table = self.machine_table()
+        if machine in table:
+            return table.has(table.mask(constraints), machine)
+        return satisfies(machine, constraints)[0]
+
+    def machines_satisfying(self, constraints):
+        """Returns the machines in the table that meet constraints."""
+        table = self.machine_table()
+        return table.machines_in(table.mask(constraints))
 
     def machines_pending(self, include_placeholders=False):
         """Returns a list of machines that have charms assigned to them which
@@ -280,14 +527,9 @@ class PlacementController:
         to e.g. get the number of real machines to wait for.
 
         """
-        ms = []
-        for m in self.machines(include_placeholders=include_placeholders):
-            if m.instance_id in self.assignments:
-                n = sum(len(cl) for _, cl in
-                        self.assignments[m.instance_id].items())
-                if n > 0:
-                    ms.append(m)
-        return ms
+        return [m for m in
+                self.machines(include_placeholders=include_placeholders)
+                if m.instance_id in self.assignments]
 
     def charm_classes(self):
         return self.bundle.charm_classes
@@ -304,37 +546,46 @@ class PlacementController:
         """
         return list(self.deployed_services)
 
+    @_locked
     def assign(self, machine, charm_class, atype):
+        changed_ids = [machine.instance_id]
         if not charm_class.allow_multi_units:
-            for m, d in self.assignments.items():
-                for at, l in d.items():
-                    if charm_class in l:
-                        l.remove(charm_class)
+            changed_ids += self.assignments.remove_charm(charm_class)
 
-        self.assignments[machine.instance_id][atype].append(charm_class)
-        self.update_and_save()
+        self.assignments.add(machine.instance_id, atype, charm_class)
+        self.update_and_save([charm_class], changed_ids,
+                             journal.record(journal.ASSIGN,
+                                            machine.instance_id,
+                                            charm_class, atype))
 
+    @_locked
     def mark_deployed(self, machine, charm_class, atype):
-        self.deployments[machine.instance_id][atype].append(charm_class)
-        self.assignments[machine.instance_id][atype].remove(charm_class)
-        self.update_and_save()
-
-    def _get_machines_by_atype(self, a_dict, charm_class):
+        if self.assignments.remove(machine.instance_id, charm_class,
+                                   atype) is None:
+            raise ValueError("{} is not assigned to {} as {}".format(
+                charm_class, machine, atype))
+        self.deployments.add(machine.instance_id, atype, charm_class)
+        self.update_and_save([charm_class], [machine.instance_id],
+                             journal.record(journal.DEPLOY,
+                                            machine.instance_id,
+                                            charm_class, atype))
+
+    def _get_machines_by_atype(self, store, charm_class):
         "Helper for get_assignments and get_deployments"
-        all_machines = self.machines()
+        placements = store.machines_for(charm_class)
+        if len(placements) == 0:
+            return defaultdict(list)
 
+        self._refresh_machines()
         machines_by_atype = defaultdict(list)
-        for m_id, d in a_dict.items():
-            m = next((m for m in all_machines
-                      if m.instance_id == m_id), None)
+        for m_id, atype_counts in placements.items():
+            m = self._machines_by_id.get(m_id)
             if not m:
                 log.debug("can't find machine for m_id '{}'".format(m_id))
                 continue
 
-            for atype, assignment_list in d.items():
-                for c in assignment_list:
-                    if c == charm_class:
-                        machines_by_atype[atype].append(m)
+            for atype, n in atype_counts.items():
+                machines_by_atype[atype] += [m] * n
 
         return machines_by_atype
 
@@ -354,10 +605,15 @@ class PlacementController:
         return self._get_machines_by_atype(self.deployments,
                                            charm_class)
 
+    @_locked
     def clear_all_assignments(self):
-        self.assignments = defaultdict(lambda: defaultdict(list))
-        self.update_and_save()
+        changed = list(self.assigned_services)
+        changed_ids = list(self.assignments)
+        self.assignments = PlacementStore()
+        self.update_and_save(changed, changed_ids,
+                             journal.record(journal.CLEAR_ALL))
 
+    @_locked
     def clear_assignments(self, m):
         """clears all assignments for machine m.
         If m has no assignments, does nothing.
@@ -365,67 +621,144 @@ class PlacementController:
         if m.instance_id not in self.assignments:
             return
 
-        del self.assignments[m.instance_id]
-        self.update_and_save()
+        changed = self.assignments.clear_machine(m.instance_id)
+        self.update_and_save(changed, [m.instance_id],
+                             journal.record(journal.CLEAR, m.instance_id))
 
+    @_locked
     def remove_one_assignment(self, m, cc):
-        ad = self.assignments[m.instance_id]
-        for atype, assignment_list in ad.items():
-            if cc in assignment_list:
-                assignment_list.remove(cc)
-                break
-        self.update_and_save()
+        self.assignments.remove(m.instance_id, cc)
+        self.update_and_save([cc], [m.instance_id],
+                             journal.record(journal.REMOVE, m.instance_id,
+                                            cc))
 
     def assignments_for_machine(self, m):
         """Returns all assignments for given machine
 
         {assignment_type: [charm_class]}
         """
-        return self.assignments[m.instance_id]
+        return self.assignments.for_machine(m.instance_id)
 
     def deployments_for_machine(self, m):
         """Returns deployments
         {atype: [charm_class]}
         """
-        return self.deployments[m.instance_id]
+        return self.deployments.for_machine(m.instance_id)
+
+    def machine_placement_revision(self, m):
+        """Returns a value that changes whenever the inventory or the
+        assignments or deployments on machine m change.
+        """
+        return (self.machines_revision,
+                self.assignments.machine_revision(m.instance_id),
+                self.deployments.machine_revision(m.instance_id))
+
+    def charm_placement_revision(self, cc):
+        """Returns a value that changes whenever the inventory or the
+        assignments or deployments of charm cc change.
+        """
+        return (self.machines_revision,
+                self.assignments.charm_revision(cc),
+                self.deployments.charm_revision(cc))
 
     def is_assigned_to(self, charm_class, machine):
-        assignment_dict = self.assignments[machine.instance_id]
-        for atype, charm_classes in assignment_dict.items():
-            if charm_class in charm_classes:
-                return True
-        return False
+        return self.assignments.has(charm_class, machine.instance_id)
 
     def is_deployed_to(self, charm_class, machine):
-        dd = self.deployments[machine.instance_id]
-        for atype, charm_classes in dd.items():
-            if charm_class in charm_classes:
-                return True
-        return False
+        return self.deployments.has(charm_class, machine.instance_id)
 
+    @_locked
     def set_all_assignments(self, assignments):
-        self.assignments = assignments
+        self.assignments = PlacementStore(assignments)
+        self._placed_generation = None
         self.update_and_save()
 
-    def reset_assigned_deployed(self):
-        self.assigned_services = set()
-        self.deployed_services = set()
+    def _placed_count(self, store, cc):
+        """Returns the number of placements of cc in store on machines
+        in the inventory. Placements on machines MAAS no longer reports
+        don't count, same as in get_assignments().
+        """
+        n = store.count(cc)
+        if n == 0:
+            return n
+        self._refresh_machines()
+        for iid, atype_counts in store.machines_for(cc).items():
+            if iid not in self._machines_by_id:
+                n -= sum(atype_counts.values())
+        return n
+
+    def _compute_assigned_deployed(self):
+        assigned = set()
+        deployed = set()
         for cc in self.charm_classes():
-            ad = self.get_assignments(cc)
-            is_assigned = False
-            for atype, al in ad.items():
-                if len(al) > 0:
-                    is_assigned = True
-            if is_assigned:
-                self.assigned_services.add(cc)
+            if self._placed_count(self.assignments, cc) > 0:
+                assigned.add(cc)
+            if self._placed_count(self.deployments, cc) > 0:
+                deployed.add(cc)
+        return assigned, deployed
 
-            dd = self.get_deployments(cc)
-            is_deployed = False
-            for atype, dl in dd.items():
-                if len(dl) > 0:
-                    is_deployed = True
-            if is_deployed:
+    def reset_assigned_deployed(self):
+        """Recomputes assigned_services and deployed_services from scratch.
+        """
+        self._charm_graph = CharmGraph(self.charm_classes())
+        self._bundle_revision = self.bundle.revision
+        # which machines count as placed depends on the inventory:
+        self._refresh_machines()
+        self._counted_generation = self.inventory.generation
+        self._charm_states = {}
+        # the journal may no longer describe how placements got here:
+        if self._journal is not None:
+            self._journal.invalidate()
+        (self.assigned_services,
+         self.deployed_services) = self._compute_assigned_deployed()
+        self._notify_changed()
+
+    def charm_graph(self):
+        """Returns the CharmGraph for the current bundle revision."""
+        if self._bundle_revision != self.bundle.revision or \
+           self._counted_generation != self.inventory.generation:
+            self.reset_assigned_deployed()
+        return self._charm_graph
+
+    def _update_assigned_deployed(self, charm_classes):
+        """Updates assigned_services and deployed_services for only the
+        given charms, whose placements have changed.
+
+        Cached charm states are dropped for the charms whose state
+        depends on those. Returns the set of those affected charms.
+        """
+        affected = set()
+        for cc in charm_classes:
+            for name in self._charm_graph.affected_by(cc):
+                self._charm_states.pop(name, None)
+                affected.add(self._charm_graph.charms.get(name, cc))
+            if self._placed_count(self.assignments, cc) > 0:
+                self.assigned_services.add(cc)
+            else:
+                self.assigned_services.discard(cc)
+            if self._placed_count(self.deployments, cc) > 0:
                 self.deployed_services.add(cc)
+            else:
+                self.deployed_services.discard(cc)
+        return affected
+
+    def check_consistency(self):
+        """Compares the incrementally maintained assigned and deployed sets
+        with a full recompute, logging any difference.
+
+        Returns True if they match.
+        """
+        assigned, deployed = self._compute_assigned_deployed()
+        ok = True
+        if assigned != self.assigned_services:
+            log.error("assigned_services out of sync: have {}, "
+                      "expected {}".format(self.assigned_services, assigned))
+            ok = False
+        if deployed != self.deployed_services:
+            log.error("deployed_services out of sync: have {}, "
+                      "expected {}".format(self.deployed_services, deployed))
+            ok = False
+        return ok
 
     def is_assigned(self, charm):
         return charm in self.assigned_services
@@ -452,35 +785,34 @@ class PlacementController:
 
         - OPTIONAL means that it is ok either way. deps and cons are unused
 
+        Results are cached until a change to the placement of this
+        charm or one of its neighbours in the charm graph.
         """
-        state = CharmState.OPTIONAL
-        conflicting = set()
-        depending = set()
-
-        def conflicts_with(other_charm):
-            return (charm.charm_name in other_charm.conflicts or
-                    other_charm.charm_name in charm.conflicts)
-
-        def depends(a_charm, b_charm):
-            return b_charm.charm_name in a_charm.depends
-
-        required_charms = [c for c in self.charm_classes()
-                           if c.is_core]
+        graph = self.charm_graph()
+        cached = self._charm_states.get(charm.charm_name)
+        if cached is not None:
+            return cached
 
-        planned_or_deployed = (self.assigned_charm_classes() +
-                               required_charms +
-                               self.deployed_charm_classes())
+        state = CharmState.OPTIONAL
 
-        for other_charm in planned_or_deployed:
-            if conflicts_with(other_charm):
-                state = CharmState.CONFLICTED
-                conflicting.add(other_charm)
-            if depends(other_charm, charm):
-                if state != CharmState.CONFLICTED:
-                    state = CharmState.REQUIRED
-                depending.add(other_charm)
+        def planned_or_deployed(name):
+            other_charm = graph.charms[name]
+            return (name in graph.required or
+                    other_charm in self.assigned_services or
+                    other_charm in self.deployed_services)
+
+        name = charm.charm_name
+        conflicting = [graph.charms[n] for n in graph.conflicts.get(name, ())
+                       if planned_or_deployed(n)]
+        depending = [graph.charms[n] for n in graph.dependents.get(name, ())
+                     if planned_or_deployed(n)]
+
+        if len(conflicting) > 0:
+            state = CharmState.CONFLICTED
+        elif len(depending) > 0:
+            state = CharmState.REQUIRED
 
-        if charm.charm_name in [c.charm_name for c in required_charms]:
+        if name in graph.required:
             state = CharmState.REQUIRED
 
         n_required = charm.required_num_units()
@@ -499,7 +831,9 @@ class PlacementController:
         elif state == CharmState.REQUIRED and n_units >= n_required:
             state = CharmState.OPTIONAL
 
-        return (state, list(conflicting), list(depending))
+        result = (state, conflicting, depending)
+        self._charm_states[name] = result
+        return result
 
     def unassigned_undeployed_services(self):
         all_charms = set(self.charm_classes())
@@ -520,34 +854,54 @@ class PlacementController:
 
     def assignment_machine_count_for_charm(self, cc):
         """Returns the total number of assignments of any type for a given
-        charm."""
-        return sum([len(al) for al in self.get_assignments(cc).values()])
+        charm, on machines in the inventory."""
+        return self._placed_count(self.assignments, cc)
 
     def deployment_machine_count_for_charm(self, cc):
         """Returns the total number of deployments of any type for a given
-        charm."""
-        return sum([len(al) for al in self.get_deployments(cc).values()])
+        charm, on machines in the inventory."""
+        return self._placed_count(self.deployments, cc)
 
+    @_locked
     def autoassign_unassigned_services(self):
         """Attempt to find machines for all required unassigned services using
         only empty machines.
 
         Returns a pair (success, message) where success is True if all
-        services are assigned. message is an info message for the user.
+        services are assigned. message is an info message for the user,
+        which on success says how many machines were used.
 
+        Uses the 'autoplace_strategy' and 'autoplace_budget' config
+        options, see gen_defaults.
         """
 
         empty_machines = [m for m in self.machines(include_placeholders=False)
-                          if len(self.assignments[m.instance_id]) == 0]
+                          if m.instance_id not in self.assignments and
+                          m.instance_id not in self.deployments]
 
         unassigned_services = list(self.unassigned_undeployed_services())
+        strategy = self.config.getopt('autoplace_strategy') or \
+            DEFAULT_STRATEGY
+        budget = self.config.getopt('autoplace_budget') or DEFAULT_BUDGET
         unassigned_defaults = self.gen_defaults(unassigned_services,
-                                                empty_machines)
+                                                empty_machines,
+                                                strategy, budget)
 
+        changed = set()
         for mid, charm_classes in unassigned_defaults.items():
-            self.assignments[mid] = charm_classes
-
-        self.update_and_save()
+            for atype, al in charm_classes.items():
+                for cc in al:
+                    self.assignments.add(mid, atype, cc)
+                    changed.add(cc)
+
+        self.update_and_save(changed, unassigned_defaults.keys())
+        n_units = sum(len(al) for iid, ad in unassigned_defaults.items()
+                      if not self.is_placeholder(iid)
+                      for al in ad.values())
+        n_machines = len([iid for iid in unassigned_defaults
+                          if not self.is_placeholder(iid)])
+        log.info("Auto-placed {} units on {} machines".format(n_units,
+                                                             n_machines))
 
         unassigned_reqs = [c for c in unassigned_services if
                            self.get_charm_state(c)[0] == CharmState.REQUIRED]
@@ -558,12 +912,107 @@ class PlacementController:
                    "try again, or finish placement manually.")
             m = ", ".join([c.charm_name for c in unassigned_reqs])
             return (False, msg + "\n" + m)
-        return (True, "")
-
-    def gen_defaults(self, charm_classes=None, maas_machines=None):
+        return (True, "Placed {} service units on {} machines.".format(
+            n_units, n_machines))
+
+    def _machine_statuses(self):
+        return {m.instance_id: m.status for m in self._real_machines}
+
+    @_locked
+    def replace_orphaned_units(self):
+        """Moves assigned units off machines that have disappeared from
+        MAAS, have gone from READY to another status (e.g. BROKEN, or
+        ALLOCATED elsewhere) and have nothing deployed on them, or no
+        longer satisfy the charm's constraints, and re-places them on
+        empty machines. All other assignments are kept, including those
+        the user made to machines that were already not READY.
+
+        Only machines that were added, removed or changed in the
+        inventory since the last call are checked, unless assignments
+        were replaced wholesale since then, e.g. by load(). Units are
+        re-placed the same way as autoassign_unassigned_services().
+
+        Returns a pair (orphaned, unplaced), lists of charm classes with
+        one entry per unit that had to move, and per unit that couldn't
+        be re-placed.
+        """
+        self._refresh_machines()
+        diff = self.inventory.diff_since(self._placed_generation)
+        if diff is None:
+            suspects = list(self.assignments)
+        else:
+            _, removed, changed = diff
+            suspects = [iid for iid in removed | changed
+                        if iid in self.assignments]
+        previous_statuses = self._placed_statuses
+        self._placed_generation = self.inventory.generation
+        self._placed_statuses = self._machine_statuses()
+
+        orphaned = []
+        changed_ids = set()
+        for iid in suspects:
+            m = self._machines_by_id.get(iid)
+            if isinstance(m, PlaceholderMachine):
+                continue
+            lost = m is None or (
+                previous_statuses.get(iid) == MaasMachineStatus.READY and
+                m.status != MaasMachineStatus.READY and
+                iid not in self.deployments)
+            for atype, al in list(self.assignments.for_machine(iid).items()):
+                for cc in list(al):
+                    if not lost and \
+                       self.machine_satisfies(m, cc.constraints):
+                        continue
+                    self.assignments.remove(iid, cc, atype)
+                    orphaned.append(cc)
+                    changed_ids.add(iid)
+
+        if len(orphaned) == 0:
+            return [], []
+
+        counts = Counter(cc.charm_name for cc in orphaned)
+        charm_classes = list({cc.charm_name: cc
+                              for cc in orphaned}.values())
+        placed = Counter()
+        if self.maas_state is not None:
+            empty_machines = [m for m in
+                              self.machines(include_placeholders=False)
+                              if m.status == MaasMachineStatus.READY and
+                              m.instance_id not in self.assignments and
+                              m.instance_id not in self.deployments]
+            strategy = self.config.getopt('autoplace_strategy') or \
+                DEFAULT_STRATEGY
+            budget = self.config.getopt('autoplace_budget') or \
+                DEFAULT_BUDGET
+            new_assignments = autoplace(charm_classes, empty_machines,
+                                        strategy, budget, counts=counts)
+            for iid, ad in new_assignments.items():
+                for atype, al in ad.items():
+                    for cc in al:
+                        self.assignments.add(iid, atype, cc)
+                        placed[cc.charm_name] += 1
+                changed_ids.add(iid)
+
+        unplaced = []
+        for cc in charm_classes:
+            unplaced += [cc] * (counts[cc.charm_name] - placed[cc.charm_name])
+
+        log.info("Re-placed {} of {} units orphaned by machine "
+                 "changes".format(len(orphaned) - len(unplaced),
+                                  len(orphaned)))
+        self.update_and_save(set(charm_classes), changed_ids)
+        return orphaned, unplaced
+
+    def gen_defaults(self, charm_classes=None, maas_machines=None,
+                     strategy=DEFAULT_STRATEGY, budget=DEFAULT_BUDGET):
         """Generates an assignments dictionary for the given charm classes and
         machines, based on constraints.
 
+        Units are packed onto as few machines as their constraints and
+        the machines' capacity allow, see autoplacer.autoplace().
+        strategy is one of autoplacer.STRATEGIES, budget is the time
+        in seconds the LOCAL_SEARCH strategy may take.
+
         Does not alter controller state.
 
         Use set_all_assignments(gen_defaults()) to clear and reset the
@@ -577,50 +1026,24 @@ class PlacementController:
         if charm_classes is None:
             charm_classes = self.charm_classes()
         log.debug("in gen_defaults, charm_classes is {}".format(charm_classes))
-        assignments = defaultdict(lambda: defaultdict(list))
 
         if maas_machines is None:
-            maas_machines = self.maas_state.machines(
-                MaasMachineStatus.READY,
-                constraints=self.config.getopt('constraints'))
-
-        def satisfying_machine(constraints):
-            for machine in maas_machines:
-                if satisfies(machine, constraints)[0]:
-                    maas_machines.remove(machine)
-                    return machine
-
-            return None
-
-        isolated_charms, controller_charms = [], []
-        subordinate_charms = []
+            maas_machines = [m for m in
+                             self.machines(include_placeholders=False)
+                             if m.status == MaasMachineStatus.READY]
 
+        required_charms, subordinate_charms = [], []
         for charm_class in charm_classes:
             state, _, _ = self.get_charm_state(charm_class)
             if state != CharmState.REQUIRED:
                 continue
-            if charm_class.isolate:
-                assert(not charm_class.subordinate)
-                isolated_charms.append(charm_class)
-            elif charm_class.subordinate:
-                assert(not charm_class.isolate)
+            if charm_class.subordinate:
                 subordinate_charms.append(charm_class)
             else:
-                controller_charms.append(charm_class)
-
-        for charm_class in isolated_charms:
-            for n in range(charm_class.required_num_units()):
-                m = satisfying_machine(charm_class.constraints)
-                if m:
-                    l = assignments[m.instance_id][AssignmentType.BareMetal]
-                    l.append(charm_class)
-
-        controller_machine = satisfying_machine({})
-        if controller_machine:
-            for charm_class in controller_charms:
-                ad = assignments[controller_machine.instance_id]
-                l = ad[DEFAULT_SHARED_ASSIGNMENT_TYPE]
-                l.append(charm_class)
+                required_charms.append(charm_class)
+
+        assignments = autoplace(required_charms, maas_machines, strategy,
+                                budget)
 
         for charm_class in subordinate_charms:
             ad = assignments[self.sub_placeholder.instance_id]
@@ -663,22 +1086,23 @@ class PlacementController:
             state, _, _ = self.get_charm_state(charm_class)
             if state != CharmState.REQUIRED:
                 continue
-            if charm_class.isolate:
-                assert(not charm_class.subordinate)
+            if charm_class.subordinate:
+                ad = assignments[self.sub_placeholder.instance_id]
+                l = ad[AssignmentType.DEFAULT]
+                l.append(charm_class)
+            elif charm_class.isolate or AssignmentType.LXC not in \
+                    charm_class.allowed_assignment_types:
                 for n in range(charm_class.required_num_units()):
                     pm = placeholder_for_charm(charm_class)
                     self._machines.append(pm)
                     ad = assignments[pm.instance_id]
                     ad[AssignmentType.DEFAULT].append(charm_class)
-            elif charm_class.subordinate:
-                assert(not charm_class.isolate)
-                ad = assignments[self.sub_placeholder.instance_id]
-                l = ad[AssignmentType.DEFAULT]
-                l.append(charm_class)
             else:
                 ad = assignments[controller.instance_id]
-                ad[AssignmentType.LXC].append(charm_class)
+                ad[AssignmentType.LXC] += [charm_class] * \
+                    charm_class.required_num_units()
 
+        self._snapshot_machines()
         import pprint
         log.debug("gen_single() = '{}'".format(pprint.pformat(assignments)))
         return assignments
@@ -0,0 +1,133 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import logging
+import os
+import threading
+from urllib.parse import quote, unquote
+
+log = logging.getLogger('bundleplacer')
+
+
+def write_atomic(filename, data, sync=True):
+    """Replaces filename with data, str or bytes, so that readers and
+    crashes see either the old contents or the new, never a partial
+    write. sync=False skips the fsync, for files that are only a cache.
+    """
+    tmpfn = "{}.{}.tmp".format(filename, os.getpid())
+    try:
+        with open(tmpfn, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmpfn, filename)
+    except BaseException:
+        try:
+            os.remove(tmpfn)
+        except OSError:
+            pass
+        raise
+
+
+class FileCache:
+    """Base for persistent caches keeping one file per key in a
+    directory.
+
+    path - directory to keep the cache in, created if needed
+
+    max_entries - when exceeded, the least recently used entries are
+    removed.
+
+    Subclasses set SUFFIX, read entries from _filename(key) and call
+    touch(key) when they use one, and write them with store().
+    """
+
+    SUFFIX = ''
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        # {key: None}, least recently used first, see _load_index():
+        self._index = None
+        # guards _index, which lookups may update from several threads:
+        self._lock = threading.RLock()
+
+    def _filename(self, key):
+        return os.path.join(self.path, quote(key, safe='') + self.SUFFIX)
+
+    def _load_index(self):
+        """Builds the index from disk, once. File mtimes are the last
+        used times of earlier runs."""
+        if self._index is not None:
+            return
+        self._index = OrderedDict()
+        if not os.path.isdir(self.path):
+            return
+        entries = []
+        for fn in os.listdir(self.path):
+            if not fn.endswith(self.SUFFIX):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.path, fn))
+            except OSError:
+                continue
+            entries.append((mtime, unquote(fn[:-len(self.SUFFIX)])))
+        for _, key in sorted(entries):
+            self._index[key] = None
+
+    def touch(self, key):
+        """Marks the entry for key as just used."""
+        try:
+            os.utime(self._filename(key))
+        except OSError:
+            pass
+        with self._lock:
+            if self._index is not None and key in self._index:
+                self._index.move_to_end(key)
+
+    def store(self, key, data):
+        """Writes data, str or bytes, as the entry for key, evicting old
+        entries if needed. OSErrors are left to the caller."""
+        with self._lock:
+            self._load_index()
+        os.makedirs(self.path, exist_ok=True)
+        write_atomic(self._filename(key), data, sync=False)
+        with self._lock:
+            self._index[key] = None
+            self._index.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries beyond max_entries."""
+        with self._lock:
+            self._load_index()
+            while len(self._index) > self.max_entries:
+                key, _ = self._index.popitem(last=False)
+                try:
+                    os.remove(self._filename(key))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try:
+                    os.remove(self._filename(key))
+                except OSError:
+                    pass
+            self._index = OrderedDict()
@@ -16,13 +16,10 @@
 import os
 import logging
 import json
-import sys
 
-# FIXME: Plan to make cloudinstall a non private library
-lib_dir = os.path.abspath('/usr/share/openstack')
-sys.path.insert(0, lib_dir)
+from cloudinstall.maas import satisfies
 
-from cloudinstall.maas import MaasMachine
+from bundleplacer.machine import PlacementMachine
 
 log = logging.getLogger('bundleplacer')
 
@@ -30,24 +27,79 @@ log = logging.getLogger('bundleplacer')
 class FakeMaasState:
     """ A fake MAAS fixture for quickly testing bundle placement
     against a set of machines
+
+    filename - JSON list of MAAS nodes, as returned by the MAAS API. By
+    default the maas-machines.json shipped in share/ is used.
+
+    The file is parsed once, and again only when its mtime or size
+    changes. Results of machines() are memoized per state and
+    constraints, so repeated calls return the same list object while
+    the file is unchanged. Don't modify the returned lists.
     """
 
-    def machines(self, state=None, constraints=None):
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._file_key = None
+        self._machines = []
+        self._results = {}
+
+    def _find_file(self):
+        if self.filename is not None:
+            return self.filename
         fakepath = '/usr/share/bundle-placer/share'
         fn = os.path.join(fakepath, "maas-machines.json")
         if not os.path.exists(fn):
             fn = os.path.join("share", "maas-machines.json")
+        return fn
+
+    def _refresh(self):
+        fn = self._find_file()
+        try:
+            st = os.stat(fn)
+        except OSError as e:
+            log.error("Can't read fake MAAS machines: {}".format(e))
+            return
+        key = (fn, st.st_mtime_ns, st.st_size)
+        if key == self._file_key:
+            return
+
+        self._file_key = key
+        self._results = {}
         with open(fn) as f:
             try:
                 nodes = json.load(f)
             except:
                 log.exception("Error loading JSON")
-                return []
-        return [MaasMachine(-1, m) for m in nodes
-                if m['hostname'] != 'juju-bootstrap.maas']
+                self._machines = []
+                return
+        self._machines = [PlacementMachine.from_maas_node(m) for m in nodes
+                          if m['hostname'] != 'juju-bootstrap.maas']
+
+    def machines(self, state=None, constraints=None):
+        self._refresh()
+        try:
+            key = (state, tuple(sorted((constraints or {}).items())))
+            hash(key)
+        except TypeError:
+            key = None
+
+        if key is not None and key in self._results:
+            return self._results[key]
+
+        ms = self._machines
+        if state is not None:
+            ms = [m for m in ms if m.status == state]
+        if constraints:
+            ms = [m for m in ms if satisfies(m, constraints)[0]]
+        else:
+            ms = list(ms)
+
+        if key is not None:
+            self._results[key] = ms
+        return ms
 
     def invalidate_nodes_cache(self):
-        "no op"
+        "no op, the file is checked for changes on every call"
 
     def machines_summary(self):
         return "no summary for fake state"
@@ -0,0 +1,168 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from bundleplacer import timing
+
+log = logging.getLogger('bundleplacer')
+
+
+DEFAULT_INVENTORY_TTL = 5
+# number of generations whose changes diff_since() can report:
+HISTORY_LENGTH = 32
+
+
+def machine_fingerprint(m):
+    """The parts of a machine that placement cares about, for detecting
+    changes between snapshots."""
+    return (m.instance_id, m.hostname, m.status, m.arch, m.cpu_cores,
+            m.mem, m.storage)
+
+
+class MachineInventory:
+
+    """A snapshot of the machines returned by a source, with a generation
+    number that increases every time the snapshot changes.
+
+    source - function returning the current list of machines
+
+    convert - optional function applied once to each new or changed
+    machine, e.g. to turn MAAS machines into compact records. Machines
+    that haven't changed keep the object from the previous snapshot.
+
+    fingerprint - function returning what a change is detected by, for
+    machines that don't have the usual hardware attributes. Defaults
+    to machine_fingerprint.
+
+    ttl - seconds a snapshot is reused before the source is asked
+    again. None means ask on every refresh(). invalidate() forces the
+    next refresh() to ask regardless.
+
+    Anything derived from the machines can be cached along with the
+    generation it was computed for, and reused while
+    changed_since(generation) is False, or updated for just the
+    machines in diff_since(generation).
+    """
+
+    def __init__(self, source, ttl=DEFAULT_INVENTORY_TTL, convert=None,
+                 fingerprint=machine_fingerprint):
+        self.source = source
+        self.convert = convert
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self.generation = 0
+        self.machines = []
+        self.by_id = {}
+        self._source_list = None
+        self._source_len = 0
+        self._fingerprints = {}
+        self._fetched_at = None
+        # [(generation, added, removed, changed)], oldest first:
+        self._history = []
+
+    def __repr__(self):
+        return "<MachineInventory generation {}, {} machines>".format(
+            self.generation, len(self.machines))
+
+    def invalidate(self):
+        """Makes the next refresh() ask the source for machines."""
+        self._fetched_at = None
+
+    def is_stale(self):
+        if self._fetched_at is None or self.ttl is None:
+            return True
+        return time.monotonic() - self._fetched_at > self.ttl
+
+    def refresh(self):
+        """Takes a new snapshot if the current one is stale.
+
+        Returns True if the machines changed, in which case the
+        generation has been increased.
+        """
+        if not self.is_stale():
+            return False
+        with timing.phase('inventory load'):
+            ms = self.source()
+        self._fetched_at = time.monotonic()
+
+        # same list as last time, nothing to compare:
+        if ms is self._source_list and len(ms) == self._source_len:
+            return False
+        self._source_list = ms
+        self._source_len = len(ms)
+
+        fingerprints = {m.instance_id: self.fingerprint(m) for m in ms}
+        if fingerprints == self._fingerprints and self.generation > 0:
+            return False
+
+        machines = []
+        for m in ms:
+            prev = self.by_id.get(m.instance_id)
+            if prev is not None and (self._fingerprints.get(m.instance_id) ==
+                                     fingerprints[m.instance_id]):
+                machines.append(prev)
+            elif self.convert is not None:
+                machines.append(self.convert(m))
+            else:
+                machines.append(m)
+
+        old, new = set(self._fingerprints), set(fingerprints)
+        changed = set(iid for iid in old & new
+                      if self._fingerprints[iid] != fingerprints[iid])
+
+        self._fingerprints = fingerprints
+        self.machines = machines
+        self.by_id = {m.instance_id: m for m in self.machines}
+        self.generation += 1
+        self._history.append((self.generation, new - old, old - new,
+                              changed))
+        del self._history[:-HISTORY_LENGTH]
+        log.debug("Machine inventory changed, now generation {} with {} "
+                  "machines".format(self.generation, len(self.machines)))
+        return True
+
+    def changed_since(self, generation):
+        """Returns True if the snapshot is newer than generation."""
+        return self.generation != generation
+
+    def diff_since(self, generation):
+        """Returns (added, removed, changed), the sets of instance ids of
+        machines that appeared, disappeared, or changed hardware or
+        status since generation. changed may include machines that
+        changed and then changed back.
+
+        Returns None if generation is too old to know, in which case
+        anything derived from it should be rebuilt.
+        """
+        added, removed, changed = set(), set(), set()
+        if generation == self.generation:
+            return added, removed, changed
+        if generation is None or len(self._history) == 0 or \
+           self._history[0][0] > generation + 1:
+            return None
+        for gen, a, r, c in self._history:
+            if gen <= generation:
+                continue
+            # a machine that comes back after being removed counts as
+            # changed, one that goes away after being added as nothing:
+            came_back = a & removed
+            added |= a - came_back
+            changed |= (c | came_back) - added
+            removed = (removed - came_back) | (r - added)
+            added -= r
+            changed -= r
+        return added, removed, changed
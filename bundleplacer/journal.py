@@ -0,0 +1,194 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Placement journal
+
+Autosaving appends one JSON line per placement change to
+<autosave file>.journal instead of rewriting the whole file, and
+rewrites it (compacts) only every so often. A journal starts with a
+header holding the digest of the snapshot it applies to:
+
+    {"base": "<sha256 of the snapshot>"}
+    {"op": "assign", "id": "node-1", "charm": "ceph", "atype": "LXC"}
+    {"op": "remove", "id": "node-1", "charm": "ceph"}
+
+Compacting writes the snapshot before starting a new journal, so a
+crash in between leaves a journal whose base doesn't match, which is
+ignored rather than applied twice.
+"""
+
+import hashlib
+import json
+import logging
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.filecache import write_atomic
+from bundleplacer.placementstore import PlacementStore
+
+log = logging.getLogger('bundleplacer')
+
+
+# records appended before the autosave file is compacted:
+DEFAULT_COMPACT_AFTER = 1000
+
+ASSIGN = 'assign'
+REMOVE = 'remove'
+DEPLOY = 'deploy'
+CLEAR = 'clear'
+CLEAR_ALL = 'clear_all'
+
+
+def journal_filename(filename):
+    return filename + '.journal'
+
+
+def snapshot_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def record(op, instance_id=None, charm_class=None, atype=None):
+    """Returns the journal record for a placement change."""
+    r = {'op': op}
+    if instance_id is not None:
+        r['id'] = instance_id
+    if charm_class is not None:
+        r['charm'] = charm_class.charm_name
+    if atype is not None:
+        r['atype'] = atype.name
+    return r
+
+
+def apply_record(r, assignments, deployments, charm_class):
+    """Replays record r onto the PlacementStores assignments and
+    deployments, making the same change the controller method that
+    wrote it did. charm_class(name) looks up charm classes.
+
+    Returns the (assignments, deployments) pair, which are new stores
+    if the record replaced them.
+    """
+    op = r['op']
+    if op == CLEAR_ALL:
+        return PlacementStore(), deployments
+    iid = r['id']
+    if op == CLEAR:
+        assignments.clear_machine(iid)
+        return assignments, deployments
+
+    cc = charm_class(r['charm'])
+    if cc is None:
+        log.warning("Could not find charm class matching journaled "
+                    "charm name {}".format(r['charm']))
+        return assignments, deployments
+    atype = None
+    if 'atype' in r:
+        atype = AssignmentType.__members__[r['atype']]
+
+    if op == ASSIGN:
+        if not cc.allow_multi_units:
+            assignments.remove_charm(cc)
+        assignments.add(iid, atype, cc)
+    elif op == REMOVE:
+        assignments.remove(iid, cc)
+    elif op == DEPLOY:
+        if assignments.remove(iid, cc, atype) is not None:
+            deployments.add(iid, atype, cc)
+    else:
+        log.warning("Ignoring unknown journal record {}".format(r))
+    return assignments, deployments
+
+
+def read_journal(filename, snapshot_text):
+    """Returns the records in the journal for the snapshot file
+    filename, whose contents are snapshot_text.
+
+    Returns [] if there is no journal, or it belongs to an older
+    snapshot. A record cut short by a crash ends the journal.
+    """
+    try:
+        with open(journal_filename(filename)) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError):
+        header = {}
+    if header.get('base') != snapshot_digest(snapshot_text):
+        log.info("Ignoring journal {}, it doesn't match the "
+                 "snapshot".format(journal_filename(filename)))
+        return []
+
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            log.warning("Ignoring incomplete journal record "
+                        "{!r}".format(line))
+            break
+    return records
+
+
+class PlacementJournal:
+    """The journal for the autosave file filename.
+
+    append() adds a record, and returns False if the journal can't take
+    it, because it hasn't been started with compact() yet, or because
+    invalidate() was called for a change that has no record. Either
+    way the caller must compact() to save the change.
+
+    Records are flushed to the OS as they are appended, which survives
+    the process crashing, and fsynced when compacting. Callers
+    serialize access.
+    """
+
+    def __init__(self, filename, compact_after=DEFAULT_COMPACT_AFTER):
+        self.filename = filename
+        self.compact_after = compact_after
+        self.records = 0
+        self._f = None
+        self._valid = False
+
+    def append(self, r):
+        if not self._valid:
+            return False
+        self._f.write(json.dumps(r, separators=(',', ':')) + '\n')
+        self._f.flush()
+        self.records += 1
+        return True
+
+    def needs_compaction(self):
+        return not self._valid or self.records >= self.compact_after
+
+    def invalidate(self):
+        """Stops appending until the next compact()."""
+        self._valid = False
+
+    def compact(self, snapshot_text):
+        """Writes snapshot_text to filename and starts an empty journal
+        for it."""
+        write_atomic(self.filename, snapshot_text)
+        header = json.dumps({'base': snapshot_digest(snapshot_text)})
+        self.close()
+        write_atomic(journal_filename(self.filename), header + '\n')
+        self._f = open(journal_filename(self.filename), 'a')
+        self.records = 0
+        self._valid = True
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        self._valid = False
@@ -0,0 +1,99 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+
+from cloudinstall.maas import MaasMachineStatus
+
+
+class PlacementMachine:
+
+    """A MAAS machine reduced to what placement needs.
+
+    Built once from a MAAS node, either the JSON dict returned by the
+    MAAS API (from_maas_node) or a cloudinstall MaasMachine
+    (from_machine). The rest of the node's payload (mac addresses,
+    routers, power settings, ...) isn't kept.
+
+    Has the same attributes as MaasMachine, and 'machine' returns a
+    node dict with the fields kept here, for code such as satisfies()
+    that reads the MAAS keys directly.
+    """
+
+    __slots__ = ('instance_id', 'system_id', 'machine_id', 'hostname',
+                 'status', 'arch', 'cpu_cores', 'mem', 'storage', 'tags',
+                 'zone')
+
+    def __init__(self, instance_id, system_id, hostname, status, arch,
+                 cpu_cores=0, mem=0, storage=0, tags=(), zone=None,
+                 machine_id=-1):
+        self.instance_id = instance_id
+        self.system_id = system_id
+        self.machine_id = machine_id
+        self.hostname = hostname
+        self.status = status
+        self.arch = arch
+        self.cpu_cores = cpu_cores
+        self.mem = mem
+        self.storage = storage
+        self.tags = tags
+        self.zone = zone
+
+    @classmethod
+    def from_maas_node(cls, node, machine_id=-1):
+        zone = node.get('zone')
+        if isinstance(zone, dict):
+            zone = zone.get('name')
+        return cls(instance_id=node['resource_uri'],
+                   system_id=node['system_id'],
+                   hostname=node['hostname'],
+                   status=MaasMachineStatus(node['status']),
+                   arch=sys.intern(node.get('architecture', '')),
+                   cpu_cores=node.get('cpu_count', 0),
+                   mem=node.get('memory', 0),
+                   storage=node.get('storage', 0),
+                   tags=tuple(sys.intern(t)
+                              for t in node.get('tag_names', ())),
+                   zone=sys.intern(zone) if zone else None,
+                   machine_id=machine_id)
+
+    @classmethod
+    def from_machine(cls, machine):
+        """Returns a PlacementMachine for a MaasMachine, or machine itself
+        if it already is one."""
+        if isinstance(machine, cls):
+            return machine
+        return cls.from_maas_node(machine.machine, machine.machine_id)
+
+    @property
+    def machine(self):
+        return {'resource_uri': self.instance_id,
+                'system_id': self.system_id,
+                'hostname': self.hostname,
+                'status': self.status.value,
+                'architecture': self.arch,
+                'cpu_count': self.cpu_cores,
+                'memory': self.mem,
+                'storage': self.storage,
+                'tag_names': list(self.tags),
+                'zone': {'name': self.zone}}
+
+    def filter_label(self):
+        return " ".join([self.hostname, self.system_id, self.arch,
+                         self.zone or ""] + list(self.tags))
+
+    def __repr__(self):
+        return "<PlacementMachine {} {}>".format(self.hostname,
+                                                 self.status)
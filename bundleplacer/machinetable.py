@@ -0,0 +1,170 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_left
+import logging
+
+from cloudinstall.maas import satisfies
+
+log = logging.getLogger('bundleplacer')
+
+
+# constraint key -> machine attribute holding the MAAS value that
+# satisfies() compares it to:
+NUMERIC_KEYS = {'mem': 'mem',
+                'storage': 'storage',
+                'cpu_cores': 'cpu_cores'}
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+class MachineTable:
+
+    """The machine inventory as columns, for answering constraint
+    queries for many machines at once.
+
+    Sets of machines are bitmasks, as python ints: bit i is set if
+    machines[i] is in the set. Each numeric column (mem, storage,
+    cpu_cores) is stored as its sorted distinct values, each with the
+    mask of machines having at least that value, so a minimum is one
+    bisect. arch and status are stored as a mask per value. A set of
+    constraints is then a handful of ANDs.
+
+    Anything the columns can't answer (unknown keys, non-numeric
+    values, machines with non-numeric hardware fields) is checked with
+    satisfies() on just the machines still in the mask, so results
+    always agree with satisfies().
+
+    Built once per inventory generation, masks are memoized per
+    constraint set for the life of the table.
+    """
+
+    def __init__(self, machines, generation=None):
+        self.generation = generation
+        self.machines = list(machines)
+        self.position = {m.instance_id: i
+                         for i, m in enumerate(self.machines)}
+        self.all_mask = (1 << len(self.machines)) - 1
+        # key -> (sorted distinct values, mask of machines >= each value):
+        self._columns = {}
+        # key -> mask of machines whose value for key isn't a number:
+        self._unindexed = {}
+        self._arch = {}
+        self._status = {}
+        self._masks = {}
+
+        for key, attr in NUMERIC_KEYS.items():
+            by_value, odd = {}, 0
+            for i, m in enumerate(self.machines):
+                v = getattr(m, attr)
+                if _is_number(v):
+                    by_value[v] = by_value.get(v, 0) | (1 << i)
+                else:
+                    odd |= 1 << i
+            values = sorted(by_value)
+            suffix, acc = [0] * len(values), 0
+            for j in range(len(values) - 1, -1, -1):
+                acc |= by_value[values[j]]
+                suffix[j] = acc
+            self._columns[key] = (values, suffix)
+            self._unindexed[key] = odd
+
+        for i, m in enumerate(self.machines):
+            self._arch[m.arch] = self._arch.get(m.arch, 0) | (1 << i)
+            self._status[m.status] = self._status.get(m.status, 0) | (1 << i)
+
+    def __repr__(self):
+        return "<MachineTable generation {}, {} machines>".format(
+            self.generation, len(self.machines))
+
+    def __contains__(self, machine):
+        i = self.position.get(machine.instance_id)
+        return i is not None and self.machines[i] is machine
+
+    def _filter(self, mask, constraints):
+        "Clears the bits of machines in mask that fail satisfies()"
+        for i in self.indexes(mask):
+            if not satisfies(self.machines[i], constraints)[0]:
+                mask &= ~(1 << i)
+        return mask
+
+    def _column_mask(self, key, value):
+        """Returns the mask of machines satisfying the single constraint
+        key=value, or None if the columns can't answer it.
+        """
+        if key == 'arch':
+            return self._arch.get(value, 0)
+        if key not in NUMERIC_KEYS or not _is_number(value):
+            return None
+        values, suffix = self._columns[key]
+        j = bisect_left(values, value)
+        mask = suffix[j] if j < len(values) else 0
+        odd = self._unindexed[key]
+        if odd:
+            mask |= self._filter(odd, {key: value})
+        return mask
+
+    def mask(self, constraints, status=None):
+        """Returns the mask of machines that satisfy constraints, and have
+        the given MaasMachineStatus if status isn't None.
+        """
+        try:
+            key = tuple(sorted(constraints.items()))
+            hash(key)
+        except TypeError:
+            key = None
+
+        if key is not None and key in self._masks:
+            mask = self._masks[key]
+        else:
+            mask, residual = self.all_mask, {}
+            for k, v in constraints.items():
+                m = self._column_mask(k, v)
+                if m is None:
+                    residual[k] = v
+                else:
+                    mask &= m
+            if residual:
+                mask = self._filter(mask, residual)
+            if key is not None:
+                self._masks[key] = mask
+
+        if status is not None:
+            mask &= self._status.get(status, 0)
+        return mask
+
+    def feasibility(self, charm_classes, status=None):
+        """Returns {charm_name: mask of machines that can host it}, for
+        every charm class in charm_classes."""
+        return {cc.charm_name: self.mask(cc.constraints, status)
+                for cc in charm_classes}
+
+    def has(self, mask, machine):
+        """Returns True if machine is in mask."""
+        i = self.position.get(machine.instance_id)
+        return i is not None and bool(mask >> i & 1)
+
+    def indexes(self, mask):
+        "Yields the positions of the bits set in mask, in order"
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def machines_in(self, mask):
+        """Returns the machines in mask, in inventory order."""
+        return [self.machines[i] for i in self.indexes(mask)]
@@ -0,0 +1,187 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import Counter
+import itertools
+
+
+# Shared by all stores so that a revision is never reused, even when a
+# store is replaced by a new one:
+_revisions = itertools.count(1)
+
+
+class PlacementStore:
+
+    """Charm placements on machines, indexed both ways.
+
+    The forward index is {instance_id: {atype: [charm class]}}, the
+    same shape the controller has always used, and is what items()
+    and for_machine() return. Empty lists and machines are pruned.
+
+    The reverse index is {charm_name: {instance_id: Counter(atype)}},
+    so per-charm queries don't have to scan every machine.
+
+    Every change stamps the machine and charm involved with a new
+    revision number, see machine_revision() and charm_revision().
+
+    Treat the dicts and lists handed out as read-only, all changes
+    must go through the methods here to keep both indexes in sync.
+    """
+
+    def __init__(self, placements=None):
+        self._machines = {}
+        self._charms = {}
+        self._counts = Counter()
+        self._machine_revs = {}
+        self._charm_revs = {}
+        if placements is not None:
+            for iid, ad in placements.items():
+                for atype, al in ad.items():
+                    for cc in al:
+                        self.add(iid, atype, cc)
+
+    def __repr__(self):
+        return "<PlacementStore {}>".format(self._machines)
+
+    def __contains__(self, instance_id):
+        return instance_id in self._machines
+
+    def __iter__(self):
+        return iter(self._machines)
+
+    def __len__(self):
+        return len(self._machines)
+
+    def items(self):
+        return self._machines.items()
+
+    def copy(self):
+        return PlacementStore(self._machines)
+
+    def add(self, instance_id, atype, charm_class):
+        ad = self._machines.setdefault(instance_id, {})
+        ad.setdefault(atype, []).append(charm_class)
+        md = self._charms.setdefault(charm_class.charm_name, {})
+        md.setdefault(instance_id, Counter())[atype] += 1
+        self._counts[charm_class.charm_name] += 1
+        self._touch(instance_id, charm_class.charm_name)
+
+    def _touch(self, instance_id, charm_name):
+        rev = next(_revisions)
+        self._machine_revs[instance_id] = rev
+        self._charm_revs[charm_name] = rev
+
+    def _discard(self, instance_id, atype, charm_class):
+        "Removes one entry known to be in the forward index"
+        ad = self._machines[instance_id]
+        al = ad[atype]
+        al.remove(charm_class)
+        if len(al) == 0:
+            del ad[atype]
+            if len(ad) == 0:
+                del self._machines[instance_id]
+
+        name = charm_class.charm_name
+        md = self._charms[name]
+        c = md[instance_id]
+        c[atype] -= 1
+        if c[atype] == 0:
+            del c[atype]
+            if len(c) == 0:
+                del md[instance_id]
+                if len(md) == 0:
+                    del self._charms[name]
+        self._counts[name] -= 1
+        if self._counts[name] == 0:
+            del self._counts[name]
+        self._touch(instance_id, name)
+
+    def remove(self, instance_id, charm_class, atype=None):
+        """Removes one placement of charm_class from instance_id.
+
+        If atype is None, the first assignment type holding the charm
+        is used. Returns the assignment type removed from, or None if
+        the charm wasn't placed there.
+        """
+        c = self._charms.get(charm_class.charm_name, {}).get(instance_id)
+        if c is None:
+            return None
+        if atype is None:
+            for at in self._machines[instance_id]:
+                if at in c:
+                    atype = at
+                    break
+        elif atype not in c:
+            return None
+        self._discard(instance_id, atype, charm_class)
+        return atype
+
+    def remove_charm(self, charm_class):
+        """Removes every placement of charm_class.
+
+        Returns the list of instance ids it was removed from.
+        """
+        md = self._charms.get(charm_class.charm_name, {})
+        removed = []
+        for iid, c in list(md.items()):
+            for atype, n in list(c.items()):
+                for _ in range(n):
+                    self._discard(iid, atype, charm_class)
+            removed.append(iid)
+        return removed
+
+    def clear_machine(self, instance_id):
+        """Removes all placements on instance_id.
+
+        Returns the list of charm classes that were removed.
+        """
+        ad = self._machines.get(instance_id, {})
+        removed = []
+        for atype, al in list(ad.items()):
+            for cc in list(al):
+                self._discard(instance_id, atype, cc)
+                removed.append(cc)
+        return removed
+
+    def for_machine(self, instance_id):
+        """Returns {atype: [charm class]} for instance_id."""
+        return self._machines.get(instance_id, {})
+
+    def machines_for(self, charm_class):
+        """Returns {instance_id: Counter(atype)} for charm_class."""
+        return self._charms.get(charm_class.charm_name, {})
+
+    def count(self, charm_class):
+        """Returns the number of placements of charm_class."""
+        return self._counts.get(charm_class.charm_name, 0)
+
+    def has(self, charm_class, instance_id):
+        return instance_id in self._charms.get(charm_class.charm_name, {})
+
+    def machine_revision(self, instance_id):
+        """Returns a number that changes whenever the placements on
+        instance_id change. 0 if it has never had any in this store.
+        """
+        return self._machine_revs.get(instance_id, 0)
+
+    def charm_revision(self, charm_class):
+        """Returns a number that changes whenever the placements of
+        charm_class change. 0 if it has never had any in this store.
+        """
+        return self._charm_revs.get(charm_class.charm_name, 0)
+
+    def charm_names(self):
+        """Returns the names of all charms with at least one placement."""
+        return self._counts.keys()
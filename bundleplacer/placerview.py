@@ -15,16 +15,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import Counter
 import logging
 
 from urwid import WidgetWrap
 from bundleplacer.ui import PlacementView
 from ubuntui.ev import EventLoop
 from ubuntui.frame import Frame
+from ubuntui.views import InfoDialogWidget
 
 log = logging.getLogger('bundleplacer')
 
 
+# Placement changes are pushed to the view by the controller, only the
+# machine inventory, which can change behind our back, is polled:
+INVENTORY_POLL_INTERVAL = 10
+
+
 class PlacerUI(Frame):
     def __init__(self, placerview):
         self.body = PlacerView
@@ -35,16 +42,91 @@ class PlacerView(WidgetWrap):
     def __init__(self, placement_controller, config):
         self.placement_controller = placement_controller
         self.config = config
+        self.loop = None
+        self.polling = False
+        self.update_scheduled = False
+        self.pending_charms = set()
+        self.pending_machines = set()
         self.pv = PlacementView(
             display_controller=self,
             placement_controller=self.placement_controller,
             config=self.config,
             do_deploy_cb=self.done_cb)
+        self.machines_revision = placement_controller.machines_revision
+        placement_controller.add_change_listener(self.handle_change)
         super().__init__(self.pv)
 
     def update(self, *args, **kwargs):
+        """Refreshes everything, and starts polling for inventory changes.
+        """
+        self.pending_charms = set()
+        self.pending_machines = set()
         self.pv.update()
-        EventLoop.set_alarm_in(1, self.update)
+        if not self.polling:
+            self.polling = True
+            EventLoop.set_alarm_in(INVENTORY_POLL_INTERVAL,
+                                   self.poll_inventory)
+
+    def handle_change(self, charm_classes, instance_ids):
+        """Change listener for the placement controller.
+
+        Changes are collected and applied together from the event loop,
+        so that bulk operations cause a single update.
+        """
+        if charm_classes is None:
+            self.pending_charms = None
+        elif self.pending_charms is not None:
+            self.pending_charms.update(charm_classes)
+        if instance_ids is None:
+            self.pending_machines = None
+        elif self.pending_machines is not None:
+            self.pending_machines.update(instance_ids)
+
+        if self.loop is None or self.update_scheduled:
+            return
+        self.update_scheduled = True
+        EventLoop.set_alarm_in(0, self.apply_pending_changes)
+
+    def apply_pending_changes(self, *args):
+        self.update_scheduled = False
+        charms, machines = self.pending_charms, self.pending_machines
+        self.pending_charms = set()
+        self.pending_machines = set()
+        self.pv.update(charm_classes=charms, instance_ids=machines)
+
+    def poll_inventory(self, *args):
+        pc = self.placement_controller
+        pc.invalidate_nodes_cache()
+        revision = pc.machines_revision
+        if revision != self.machines_revision:
+            log.debug("Machine inventory changed, refreshing")
+            self.machines_revision = revision
+            orphaned, unplaced = pc.replace_orphaned_units()
+            self.pv.update()
+            if len(orphaned) > 0:
+                self.show_orphaned_message(orphaned, unplaced)
+        EventLoop.set_alarm_in(INVENTORY_POLL_INTERVAL, self.poll_inventory)
+
+    def show_orphaned_message(self, orphaned, unplaced):
+        """Tells the user which units replace_orphaned_units() moved, and
+        which it couldn't find a machine for."""
+        def describe(counts):
+            return "\n".join("  {} x {}".format(n, name)
+                             for name, n in sorted(counts.items()))
+
+        moved = Counter(cc.charm_name for cc in orphaned)
+        left = Counter(cc.charm_name for cc in unplaced)
+        moved.subtract(left)
+        moved = +moved
+        msg = "Machines with assigned services were removed or changed " \
+              "in MAAS."
+        if len(moved) > 0:
+            msg += "\n\nMoved to other machines:\n" + describe(moved)
+        if len(left) > 0:
+            msg += "\n\nLeft unassigned, no machines were available:\n" + \
+                   describe(left)
+        log.info(msg)
+        self.pv.show_overlay(InfoDialogWidget(msg, self.pv.remove_overlay))
 
     def status_error_message(self, message):
         pass
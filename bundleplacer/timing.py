@@ -0,0 +1,58 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Startup timing
+
+Code that runs during startup wraps its expensive parts in
+
+    with timing.phase('bundle parse'):
+        ...
+
+and bundle-placer --timings reports the total time spent in each
+phase. Phases cost two perf_counter() calls whether or not a report is
+asked for.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+_totals = OrderedDict()
+_started = time.perf_counter()
+
+
+@contextmanager
+def phase(name):
+    """Adds the time spent in the with block to the named phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _totals[name] = _totals.get(name, 0) + time.perf_counter() - start
+
+
+def totals():
+    """Returns {phase name: seconds}, in the order phases first ran."""
+    return OrderedDict(_totals)
+
+
+def report():
+    """Returns a printable breakdown of the time spent in each phase, and
+    since this module was imported."""
+    lines = ["{:<20} {:8.1f} ms".format(name, secs * 1000)
+             for name, secs in _totals.items()]
+    lines.append("{:<20} {:8.1f} ms".format(
+        "total", (time.perf_counter() - _started) * 1000))
+    return "\n".join(lines)
@@ -117,10 +117,13 @@ class ServicesColumn(WidgetWrap):
 
         return self.main_pile
 
-    def update(self):
+    def update(self, charm_classes=None):
+        """Refreshes the column. If charm_classes is given, only the
+        widgets for those charms are updated.
+        """
         self.deploy_view.update()
-        self.required_services_list.update()
-        self.additional_services_list.update()
+        self.required_services_list.update(charm_classes)
+        self.additional_services_list.update(charm_classes)
 
         top_buttons = []
         unplaced = self.placement_controller.unassigned_undeployed_services()
@@ -269,8 +272,11 @@ class MachinesColumn(WidgetWrap):
 
         return self.main_pile
 
-    def update(self):
-        self.machines_list.update()
+    def update(self, instance_ids=None):
+        """Refreshes the column. If instance_ids is given, only the widgets
+        for those machines are updated.
+        """
+        self.machines_list.update(instance_ids)
 
         bc = self.placement_view.config.juju_env['bootstrap-config']
         empty_maas_msg = ("There are no available machines.\n"
@@ -355,9 +361,17 @@ class PlacementView(WidgetWrap):
                                        width=('relative', 95))])
         return Filler(self.main_pile, valign='top')
 
-    def update(self):
-        self.services_column.update()
-        self.machines_column.update()
+    def update(self, charm_classes=None, instance_ids=None):
+        """Refreshes both columns.
+
+        charm_classes and instance_ids limit the update to the given
+        charms and machines, None means all of them. Pass an empty set
+        to skip a column.
+        """
+        if charm_classes is None or len(charm_classes) > 0:
+            self.services_column.update(charm_classes)
+        if instance_ids is None or len(instance_ids) > 0:
+            self.machines_column.update(instance_ids)
 
     def do_autoplace(self, sender):
         ok, msg = self.placement_controller.autoassign_unassigned_services()
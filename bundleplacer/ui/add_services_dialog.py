@@ -116,21 +116,30 @@ class AddServicesDialog(WidgetWrap):
             return (charm_class.required_num_units() -
                     self.pc.assignment_machine_count_for_charm(charm_class))
 
+        def unassigned_required(cc):
+            return (not self.pc.is_assigned(cc) and
+                    not self.pc.is_deployed(cc) and
+                    self.pc.get_charm_state(cc)[0] == CharmState.REQUIRED)
+
         for i in range(max(1, num_to_auto_add(charm_class))):
             self.pc.assign(self.pc.def_placeholder, charm_class,
                            AssignmentType.DEFAULT)
 
-        def get_unassigned_requireds():
-            return [cc for cc in
-                    self.pc.unassigned_undeployed_services()
-                    if self.pc.get_charm_state(cc)[0] ==
-                    CharmState.REQUIRED]
-
-        while len(get_unassigned_requireds()) > 0:
-            for u_r_cc in get_unassigned_requireds():
-                for i in range(num_to_auto_add(u_r_cc)):
-                    self.pc.assign(self.pc.def_placeholder, u_r_cc,
-                                   AssignmentType.DEFAULT)
+        # Adding a charm can only make its dependencies newly required,
+        # so after one pass over the charms that were already required,
+        # follow the dependency graph from what gets added:
+        graph = self.pc.charm_graph()
+        pending = [cc for cc in self.pc.unassigned_undeployed_services()
+                   if unassigned_required(cc)]
+        pending += graph.charm_dependencies(charm_class)
+        while len(pending) > 0:
+            u_r_cc = pending.pop()
+            if not unassigned_required(u_r_cc):
+                continue
+            for i in range(num_to_auto_add(u_r_cc)):
+                self.pc.assign(self.pc.def_placeholder, u_r_cc,
+                               AssignmentType.DEFAULT)
+            pending += graph.charm_dependencies(u_r_cc)
         self.update()
 
     def do_remove(self, sender, charm_class):
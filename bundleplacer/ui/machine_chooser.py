@@ -73,7 +73,8 @@ class MachineChooser(WidgetWrap):
                                           actions,
                                           constraints=constraints,
                                           show_hardware=True,
-                                          show_assignments=False)
+                                          show_assignments=False,
+                                          visible_rows=20)
         self.machines_list.update()
         close_button = AttrMap(Button('X',
                                       on_press=self.close_pressed),
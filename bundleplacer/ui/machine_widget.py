@@ -40,6 +40,9 @@ class MachineWidget(WidgetWrap):
 
     show_assignments - display info about which charms are assigned
     and what assignment type (LXC, KVM, etc) they have.
+
+    update() only redraws when the machine or its placements have
+    changed since the last redraw, or after mark_dirty().
     """
 
     def __init__(self, machine, controller, actions=None,
@@ -52,6 +55,7 @@ class MachineWidget(WidgetWrap):
             self.actions = actions
         self.show_hardware = show_hardware
         self.show_assignments = show_assignments
+        self.rendered_revision = None
         w = self.build_widgets()
         self.update()
         super().__init__(w)
@@ -91,12 +95,19 @@ class MachineWidget(WidgetWrap):
         Assumes that machine exists - machines going away is handled
         in machineslist.update().
         """
-        self.machine = next((m for m in self.controller.machines()
-                             if m.instance_id == self.machine.instance_id),
-                            None)
+        self.machine = self.controller.machine_by_id(self.machine.instance_id)
+
+    def mark_dirty(self):
+        self.rendered_revision = None
 
-    def update(self):
+    def update(self, force=False):
+        """Redraws if anything shown has changed. Returns True if it did."""
         self.update_machine()
+        rev = self.controller.machine_placement_revision(self.machine)
+        if not force and rev == self.rendered_revision:
+            return False
+        self.rendered_revision = rev
+
         if self.machine == self.controller.sub_placeholder:
             self.machine_info_widget.set_text("\N{BULLET} Subordinate Charms")
             self.hardware_widget.set_text("")
@@ -142,6 +153,7 @@ class MachineWidget(WidgetWrap):
 
         self.assignments_widget.set_text(assignments_text)
         self.update_buttons()
+        return True
 
     def update_buttons(self):
         buttons = []
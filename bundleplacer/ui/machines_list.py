@@ -13,10 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
 import logging
-from urwid import (AttrMap, Divider, Padding, Pile, Text, WidgetWrap)
-
-from cloudinstall.maas import satisfies
+from urwid import (AttrMap, BoxAdapter, Divider, ListBox, ListWalker,
+                   Padding, Pile, Text, WidgetWrap)
 
 from bundleplacer.ui.filter_box import FilterBox
 from bundleplacer.ui.machine_widget import MachineWidget
@@ -24,6 +24,112 @@ from bundleplacer.ui.machine_widget import MachineWidget
 log = logging.getLogger('bundleplacer')
 
 
+DEFAULT_VISIBLE_ROWS = 40
+MAX_CACHED_ROWS = 64
+
+
+class MachineWalker(ListWalker):
+
+    """Supplies machine rows to a ListBox, building them only when the
+    ListBox asks for them, i.e. when they are near the viewport.
+
+    Positions are indexes into instance_ids, the machines currently
+    shown. At most max_cached rows are kept around, the least recently
+    displayed ones are dropped and rebuilt if they are needed again.
+
+    make_row - function taking an instance id and returning a
+    (MachineWidget, row widget) pair, or None if there is no such
+    machine any more. Such ids are skipped.
+
+    Rows are built from the machine's state at the time, keeping them
+    up to date is up to the owner, see MachinesList.update().
+    """
+
+    def __init__(self, make_row, max_cached=MAX_CACHED_ROWS):
+        self.make_row = make_row
+        self.max_cached = max_cached
+        self.instance_ids = []
+        self.focus = 0
+        # {instance_id: (MachineWidget, row widget)}, least recent first:
+        self.rows = OrderedDict()
+
+    def __len__(self):
+        return len(self.instance_ids)
+
+    def set_instance_ids(self, instance_ids):
+        focus_id = self.focus_instance_id()
+        self.instance_ids = instance_ids
+        if focus_id in instance_ids:
+            self.focus = instance_ids.index(focus_id)
+        else:
+            # e.g. filtered out, start from the top of the new list:
+            self.focus = 0
+        for iid in [iid for iid in self.rows if iid not in instance_ids]:
+            del self.rows[iid]
+        self._modified()
+
+    def focus_instance_id(self):
+        if 0 <= self.focus < len(self.instance_ids):
+            return self.instance_ids[self.focus]
+        return None
+
+    def cached_widget(self, instance_id):
+        """Returns the MachineWidget for instance_id if it is built."""
+        row = self.rows.get(instance_id)
+        if row is None:
+            return None
+        return row[0]
+
+    def _row(self, position):
+        iid = self.instance_ids[position]
+        row = self.rows.get(iid)
+        if row is None:
+            row = self.make_row(iid)
+            if row is None:
+                return None
+            self.rows[iid] = row
+            self._recycle()
+        else:
+            self.rows.move_to_end(iid)
+        return row[1]
+
+    def _find(self, position, step):
+        """Returns (row widget, position) for the first machine that
+        still exists at position or beyond it in direction step, or
+        (None, None)."""
+        while 0 <= position < len(self.instance_ids):
+            w = self._row(position)
+            if w is not None:
+                return w, position
+            position += step
+        return None, None
+
+    def _recycle(self):
+        focus_id = self.focus_instance_id()
+        while len(self.rows) > self.max_cached:
+            iid = next(iter(self.rows))
+            if iid == focus_id:
+                self.rows.move_to_end(iid)
+                iid = next(iter(self.rows))
+            del self.rows[iid]
+
+    def get_focus(self):
+        w, position = self._find(self.focus, 1)
+        if w is None:
+            return self._find(self.focus - 1, -1)
+        return w, position
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        return self._find(position + 1, 1)
+
+    def get_prev(self, position):
+        return self._find(position - 1, -1)
+
+
 class MachinesList(WidgetWrap):
 
     """A list of machines with configurable action buttons for each
@@ -45,21 +151,28 @@ class MachinesList(WidgetWrap):
     show_assignments - bool, whether or not to show the assignments
     for each of the machines.
 
+    visible_rows - height in screen rows of the scrolling list.
+
+    Only the rows near the viewport have widgets, see MachineWalker,
+    so the cost of drawing the list doesn't grow with the number of
+    machines.
     """
 
     def __init__(self, controller, actions, constraints=None,
                  show_hardware=False, title_widgets=None,
-                 show_assignments=True):
+                 show_assignments=True, visible_rows=DEFAULT_VISIBLE_ROWS):
         self.controller = controller
         self.actions = actions
-        self.machine_widgets = []
         if constraints is None:
             self.constraints = {}
         else:
             self.constraints = constraints
         self.show_hardware = show_hardware
         self.show_assignments = show_assignments
+        self.visible_rows = visible_rows
         self.filter_string = ""
+        self.n_satisfying_machines = 0
+        self.walker = MachineWalker(self.make_row)
         w = self.build_widgets(title_widgets)
         self.update()
         super().__init__(w)
@@ -80,30 +193,41 @@ class MachinesList(WidgetWrap):
             title_widgets = Text("Machines" + cstr, align='center')
 
         self.filter_edit_box = FilterBox(self.handle_filter_change)
+        self.machine_listbox = ListBox(self.walker)
 
         self.machine_pile = Pile([title_widgets,
                                   Divider(),
-                                  self.filter_edit_box] +
-                                 self.machine_widgets)
+                                  self.filter_edit_box,
+                                  BoxAdapter(self.machine_listbox,
+                                             self.visible_rows)])
         return self.machine_pile
 
+    @property
+    def machine_widgets(self):
+        """The MachineWidgets that are currently built, by instance id."""
+        return {iid: row[0] for iid, row in self.walker.rows.items()}
+
     def handle_filter_change(self, edit_button, userdata):
         self.filter_string = userdata
         self.update()
 
     def find_machine_widget(self, m):
-        return next((mw for mw in self.machine_widgets if
-                     mw.machine.instance_id == m.instance_id), None)
+        return self.walker.cached_widget(m.instance_id)
 
-    def update(self):
-        machines = self.controller.machines()
-        for mw in self.machine_widgets:
-            machine = next((m for m in machines if
-                            mw.machine.instance_id == m.instance_id), None)
-            if machine is None:
-                self.remove_machine(mw.machine)
+    def make_row(self, instance_id):
+        machine = self.controller.machine_by_id(instance_id)
+        if machine is None:
+            return None
+        mw = MachineWidget(machine, self.controller, self.actions,
+                           self.show_hardware, self.show_assignments)
+        divider = AttrMap(Padding(Divider('\u23bc'), left=2, right=2),
+                          'label')
+        return mw, Pile([mw, divider])
 
-        n_satisfying_machines = len(machines)
+    def is_shown(self, m):
+        """Returns a pair (satisfies, shown) of whether the machine meets
+        the list's constraints, and whether it also passes the filter.
+        """
 
         def get_placement_filter_label(d):
             s = ""
@@ -113,59 +237,50 @@ class MachinesList(WidgetWrap):
                                for cc in al])
             return s
 
-        for m in machines:
-            if not satisfies(m, self.constraints)[0]:
-                self.remove_machine(m)
-                n_satisfying_machines -= 1
-                continue
-
-            assignment_names = ""
-            ad = self.controller.assignments_for_machine(m)
-            assignment_names = get_placement_filter_label(ad)
-            dd = self.controller.deployments_for_machine(m)
-            deployment_names = get_placement_filter_label(dd)
-            filter_label = "{} {} {}".format(m.filter_label(),
-                                             assignment_names,
-                                             deployment_names)
-
-            if self.filter_string != "" and \
-               self.filter_string not in filter_label:
-                self.remove_machine(m)
-                continue
-
-            mw = self.find_machine_widget(m)
-
-            if mw is None:
-                mw = self.add_machine_widget(m)
+        if not self.controller.machine_satisfies(m, self.constraints):
+            return False, False
+        if self.filter_string == "":
+            return True, True
+
+        ad = self.controller.assignments_for_machine(m)
+        assignment_names = get_placement_filter_label(ad)
+        dd = self.controller.deployments_for_machine(m)
+        deployment_names = get_placement_filter_label(dd)
+        filter_label = "{} {} {}".format(m.filter_label(),
+                                         assignment_names,
+                                         deployment_names)
+        return True, self.filter_string in filter_label
+
+    def update(self, instance_ids=None):
+        """Refreshes the list. If instance_ids is given, only those machines
+        are re-checked, and the list is only rebuilt if one of them
+        was shown or hidden.
+        """
+        if instance_ids is not None:
+            shown = set(self.walker.instance_ids)
+            for iid in instance_ids:
+                m = self.controller.machine_by_id(iid)
+                is_shown = m is not None and self.is_shown(m)[1]
+                if is_shown != (iid in shown):
+                    break
+                mw = self.walker.cached_widget(iid)
+                if mw is not None:
+                    mw.update()
+            else:
+                return
+
+        shown = []
+        n_satisfying_machines = 0
+        for m in self.controller.machines():
+            satisfying, is_shown = self.is_shown(m)
+            if satisfying:
+                n_satisfying_machines += 1
+            if is_shown:
+                shown.append(m.instance_id)
+        self.n_satisfying_machines = n_satisfying_machines
+        self.walker.set_instance_ids(shown)
+        # rows that aren't built yet will be built up to date:
+        for mw, _ in list(self.walker.rows.values()):
             mw.update()
 
-        self.filter_edit_box.set_info(len(self.machine_widgets),
-                                      n_satisfying_machines)
-
-    def add_machine_widget(self, machine):
-        mw = MachineWidget(machine, self.controller, self.actions,
-                           self.show_hardware, self.show_assignments)
-        self.machine_widgets.append(mw)
-        options = self.machine_pile.options()
-        self.machine_pile.contents.append((mw, options))
-
-        self.machine_pile.contents.append((AttrMap(Padding(Divider('\u23bc'),
-                                                           left=2, right=2),
-                                                   'label'), options))
-        return mw
-
-    def remove_machine(self, machine):
-        mw = self.find_machine_widget(machine)
-        if mw is None:
-            return
-
-        self.machine_widgets.remove(mw)
-        mw_idx = 0
-        for w, opts in self.machine_pile.contents:
-            if w == mw:
-                break
-            mw_idx += 1
-
-        c = self.machine_pile.contents[:mw_idx] + \
-            self.machine_pile.contents[mw_idx + 2:]
-        self.machine_pile.contents = c
+        self.filter_edit_box.set_info(len(shown), n_satisfying_machines)
@@ -43,6 +43,8 @@ class ServiceWidget(WidgetWrap):
     host this service, both planned deployments (aka 'assignments',
     and already-deployed, called 'deployments').
 
+    update() only redraws when the charm's state or placements have
+    changed since the last redraw, or after mark_dirty().
     """
 
     def __init__(self, charm_class, controller, actions=None,
@@ -55,6 +57,7 @@ class ServiceWidget(WidgetWrap):
             self.actions = actions
         self.show_constraints = show_constraints
         self.show_placements = show_placements
+        self.rendered_revision = None
         w = self.build_widgets()
         self.update()
         super().__init__(w)
@@ -96,10 +99,19 @@ class ServiceWidget(WidgetWrap):
         p = Pile(pl)
         return Padding(p, left=2, right=2)
 
-    def update(self):
-        mstr = [""]
+    def mark_dirty(self):
+        self.rendered_revision = None
 
+    def update(self, force=False):
+        """Redraws if anything shown has changed. Returns True if it did."""
         state, cons, deps = self.controller.get_charm_state(self.charm_class)
+        rev = (self.controller.charm_placement_revision(self.charm_class),
+               state, tuple(cons), tuple(deps))
+        if not force and rev == self.rendered_revision:
+            return False
+        self.rendered_revision = rev
+
+        mstr = [""]
 
         if state == CharmState.REQUIRED:
             p = self.controller.get_assignments(self.charm_class)
@@ -151,6 +163,7 @@ class ServiceWidget(WidgetWrap):
         self.placements_widget.set_text(mstr)
 
         self.update_buttons()
+        return True
 
     def update_buttons(self):
         buttons = []
@@ -18,7 +18,6 @@ import logging
 from urwid import (AttrMap, Divider, Padding, Pile, Text,
                    WidgetWrap)
 
-from cloudinstall.maas import satisfies
 from cloudinstall.state import CharmState
 from bundleplacer.ui.service_widget import ServiceWidget
 
@@ -56,6 +55,9 @@ class ServicesList(WidgetWrap):
 
     trace_updates - bool, enable verbose update logging
 
+    Widgets are kept in a dict keyed by charm name. Rows removed
+    during an update are taken out of the pile together in one pass
+    at the end of it.
     """
 
     def __init__(self, controller, actions, subordinate_actions,
@@ -67,7 +69,10 @@ class ServicesList(WidgetWrap):
         self.controller = controller
         self.actions = actions
         self.subordinate_actions = subordinate_actions
-        self.service_widgets = []
+        # {charm_name: ServiceWidget}, in display order:
+        self.service_widgets = {}
+        self.dividers = {}
+        self.removed_rows = set()
         self.machine = machine
         self.ignore_assigned = ignore_assigned
         self.ignore_deployed = ignore_deployed
@@ -90,88 +95,100 @@ class ServicesList(WidgetWrap):
 
     def build_widgets(self):
         self.service_pile = Pile([Text(self.title),
-                                  Divider(' ')] +
-                                 self.service_widgets)
+                                  Divider(' ')])
         return self.service_pile
 
     def find_service_widget(self, cc):
-        return next((sw for sw in self.service_widgets if
-                     sw.charm_class.charm_name == cc.charm_name), None)
+        return self.service_widgets.get(cc.charm_name)
 
-    def update(self):
+    def update(self, charm_classes=None):
+        """Refreshes the list. If charm_classes is given, only those charms
+        are re-checked and redrawn.
+        """
+        if charm_classes is None:
+            charm_classes = self.controller.charm_classes()
+        for cc in charm_classes:
+            self.update_charm(cc)
+        self.remove_pending_rows()
+
+    def update_charm(self, cc):
+        """Adds, removes or refreshes the widget for a single charm."""
 
         def trace(cc, s):
             if self.trace:
                 log.debug("{}: {} {}".format(self.title, cc, s))
 
-        for cc in self.controller.charm_classes():
-            if self.machine:
-                if not satisfies(self.machine, cc.constraints)[0] \
-                   or not (self.controller.is_assigned_to(cc, self.machine) or
-                           self.controller.is_deployed_to(cc, self.machine)):
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because machine doesn't match")
-                    continue
-
-            if self.ignore_assigned and self.assigned_only:
-                raise Exception("Can't both ignore and only show assigned.")
-
-            if self.ignore_assigned:
-                n = self.controller.assignment_machine_count_for_charm(cc)
-                if n == cc.required_num_units() \
-                   and not cc.allow_multi_units \
-                   and self.controller.is_assigned(cc):
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because max units are "
-                          "assigned")
-                    continue
-            elif self.assigned_only:
-                if not self.controller.is_assigned(cc):
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because it is not assigned and "
-                          "assigned_only is True")
-                    continue
-
-            if self.ignore_deployed and self.deployed_only:
-                raise Exception("Can't both ignore and only show deployed.")
-
-            if self.ignore_deployed:
-                n = self.controller.deployment_machine_count_for_charm(cc)
-                if n == cc.required_num_units() \
-                   and self.controller.is_deployed(cc):
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because the required number of units"
-                          " has been deployed")
-                    continue
-            elif self.deployed_only:
-                if not self.controller.is_deployed(cc):
-                    self.remove_service_widget(cc)
-                    continue
-
-            state, _, _ = self.controller.get_charm_state(cc)
-            if self.show_type == 'required':
-                if state != CharmState.REQUIRED:
-                    self.remove_service_widget(cc)
-                    continue
-            elif self.show_type == 'non-required':
-                if state == CharmState.REQUIRED:
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because show_type is 'non-required' and"
-                          "state is REQUIRED.")
-                    continue
-                assigned_or_deployed = (self.controller.is_assigned(cc) or
-                                        self.controller.is_deployed(cc))
-                if not cc.allow_multi_units and assigned_or_deployed:
-                    self.remove_service_widget(cc)
-                    trace(cc, "removed because it doesn't allow multiple units"
-                          " and is not assigned or deployed.")
-                    continue
-
-            sw = self.find_service_widget(cc)
-            if sw is None:
-                sw = self.add_service_widget(cc)
-                trace(cc, "added widget")
-            sw.update()
+        if self.machine:
+            if not self.controller.machine_satisfies(self.machine,
+                                                     cc.constraints) \
+               or not (self.controller.is_assigned_to(cc, self.machine) or
+                       self.controller.is_deployed_to(cc, self.machine)):
+                self.remove_service_widget(cc)
+                trace(cc, "removed because machine doesn't match")
+                return
+
+        if self.ignore_assigned and self.assigned_only:
+            raise Exception("Can't both ignore and only show assigned.")
+
+        if self.ignore_assigned:
+            n = self.controller.assignment_machine_count_for_charm(cc)
+            if n == cc.required_num_units() \
+               and not cc.allow_multi_units \
+               and self.controller.is_assigned(cc):
+                self.remove_service_widget(cc)
+                trace(cc, "removed because max units are "
+                      "assigned")
+                return
+        elif self.assigned_only:
+            if not self.controller.is_assigned(cc):
+                self.remove_service_widget(cc)
+                trace(cc, "removed because it is not assigned and "
+                      "assigned_only is True")
+                return
+
+        if self.ignore_deployed and self.deployed_only:
+            raise Exception("Can't both ignore and only show deployed.")
+
+        if self.ignore_deployed:
+            n = self.controller.deployment_machine_count_for_charm(cc)
+            if n == cc.required_num_units() \
+               and self.controller.is_deployed(cc):
+                self.remove_service_widget(cc)
+                trace(cc, "removed because the required number of units"
+                      " has been deployed")
+                return
+        elif self.deployed_only:
+            if not self.controller.is_deployed(cc):
+                self.remove_service_widget(cc)
+                return
+
+        state, _, _ = self.controller.get_charm_state(cc)
+        if self.show_type == 'required':
+            if state != CharmState.REQUIRED:
+                self.remove_service_widget(cc)
+                return
+        elif self.show_type == 'non-required':
+            if state == CharmState.REQUIRED:
+                self.remove_service_widget(cc)
+                trace(cc, "removed because show_type is 'non-required' and"
+                      "state is REQUIRED.")
+                return
+            assigned_or_deployed = (self.controller.is_assigned(cc) or
+                                    self.controller.is_deployed(cc))
+            if not cc.allow_multi_units and assigned_or_deployed:
+                self.remove_service_widget(cc)
+                trace(cc, "removed because it doesn't allow multiple units"
+                      " and is not assigned or deployed.")
+                return
+
+        # it may have come back before the pile was cleaned up:
+        self.removed_rows.discard(cc.charm_name)
+
+        sw = self.find_service_widget(cc)
+        if sw is None:
+            sw = self.add_service_widget(cc)
+            trace(cc, "added widget")
+        sw.update()
 
     def add_service_widget(self, charm_class):
         if charm_class.subordinate:
@@ -181,26 +198,31 @@ class ServicesList(WidgetWrap):
         sw = ServiceWidget(charm_class, self.controller, actions,
                            self.show_constraints,
                            show_placements=self.show_placements)
-        self.service_widgets.append(sw)
+        divider = AttrMap(Padding(Divider('\u23bc'), left=2, right=2),
+                          'label')
+        self.service_widgets[charm_class.charm_name] = sw
+        self.dividers[charm_class.charm_name] = divider
         options = self.service_pile.options()
         self.service_pile.contents.append((sw, options))
-        self.service_pile.contents.append((AttrMap(Padding(Divider('\u23bc'),
-                                                           left=2, right=2),
-                                                   'label'), options))
+        self.service_pile.contents.append((divider, options))
         return sw
 
     def remove_service_widget(self, charm_class):
-        sw = self.find_service_widget(charm_class)
+        """Drops the widget for charm_class. Its rows stay in the pile until
+        remove_pending_rows() is called.
+        """
+        if charm_class.charm_name not in self.service_widgets:
+            return
+        self.removed_rows.add(charm_class.charm_name)
 
-        if sw is None:
+    def remove_pending_rows(self):
+        if len(self.removed_rows) == 0:
             return
-        self.service_widgets.remove(sw)
-        sw_idx = 0
-        for w, opts in self.service_pile.contents:
-            if w == sw:
-                break
-            sw_idx += 1
-
-        c = self.service_pile.contents[:sw_idx] + \
-            self.service_pile.contents[sw_idx + 2:]
-        self.service_pile.contents = c
+        gone = set()
+        for name in self.removed_rows:
+            gone.add(id(self.service_widgets.pop(name)))
+            gone.add(id(self.dividers.pop(name)))
+        self.removed_rows = set()
+        self.service_pile.contents = [(w, o) for w, o in
+                                      self.service_pile.contents
+                                      if id(w) not in gone]
@@ -0,0 +1,76 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" YAML loading and dumping
+
+Uses libyaml's C parser and emitter when PyYAML was built with it, and
+the pure python ones otherwise. Only plain YAML (mappings, lists,
+scalars) is read or written.
+"""
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+    HAVE_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
+    HAVE_LIBYAML = False
+
+
+DEFAULTDICT_TAG = ('tag:yaml.org,2002:python/object/apply:'
+                   'collections.defaultdict')
+
+
+class Loader(_SafeLoader):
+
+    """Safe loader that also reads the defaultdicts written by older
+    versions of PlacementController.save(), as plain dicts."""
+
+    def construct_defaultdict(self, node):
+        # an empty one is written as just its args, a sequence:
+        if not isinstance(node, yaml.MappingNode):
+            return {}
+        for key_node, value_node in node.value:
+            if self.construct_scalar(key_node) == 'dictitems':
+                return self.construct_mapping(value_node, deep=True)
+        return {}
+
+
+Loader.add_constructor(DEFAULTDICT_TAG, Loader.construct_defaultdict)
+
+
+class Dumper(_SafeDumper):
+    pass
+
+
+def load(f):
+    """Returns the document in f, a file object or string."""
+    return yaml.load(f, Loader=Loader)
+
+
+def plain(data):
+    """Returns data with defaultdicts and OrderedDicts turned into dicts,
+    recursively, so the safe dumper can represent it."""
+    if isinstance(data, dict):
+        return {k: plain(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [plain(v) for v in data]
+    return data
+
+
+def dump(data, f=None, **kwargs):
+    """Writes data to f, or returns it as a string if f is None."""
+    return yaml.dump(plain(data), f, Dumper=Dumper, **kwargs)
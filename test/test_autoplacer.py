@@ -0,0 +1,178 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from cloudinstall.maas import MaasMachineStatus
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer import autoplacer
+from bundleplacer.autoplacer import (PlacementProblem, Unit, pack, search,
+                                     parallel_search, FIRST_FIT_DECREASING,
+                                     BEST_FIT_DECREASING)
+from bundleplacer.bundle import Bundle
+from bundleplacer.fixtures.maas import FakeMaasState
+from bundleplacer import yamlio
+
+from test_controller import ControllerTestCase, BUNDLE, METADATA, NODES
+
+
+def problem(capacities, units_per_charm, demand):
+    """Machines with the given (cpu_cores, mem, storage) capacities, in
+    ascending order, and units_per_charm shared units of each of a few
+    charms, all feasible everywhere."""
+    everywhere = (1 << len(capacities)) - 1
+    units = []
+    for name, n in units_per_charm.items():
+        units += [Unit(name, AssignmentType.LXC, demand, everywhere,
+                       False, ())] * n
+    return PlacementProblem(['m{}'.format(i) for i in range(len(capacities))],
+                            capacities, units)
+
+
+class PackTestCase(unittest.TestCase):
+
+    def check(self, p, solution):
+        "Every unit placed, within capacity, one unit per charm per machine"
+        self.assertEqual(solution.unplaced(), [])
+        by_machine = {}
+        for unit, m in zip(p.units, solution.machine_of):
+            by_machine.setdefault(m, []).append(unit)
+        for m, units in by_machine.items():
+            names = [u.charm_name for u in units]
+            self.assertEqual(len(names), len(set(names)))
+            for d in range(3):
+                self.assertLessEqual(sum(u.demand[d] for u in units),
+                                     p.capacity[m][d])
+
+    def test_mixed_sizes_use_large_machines(self):
+        "new shared machines are opened largest first"
+        p = problem([(4, 8, 100)] * 20 + [(32, 64, 100)] * 2,
+                    {'c{}'.format(i): 2 for i in range(8)}, (2, 1, 0))
+        for strategy in (FIRST_FIT_DECREASING, BEST_FIT_DECREASING):
+            solution = pack(p, strategy)
+            self.check(p, solution)
+            self.assertEqual(solution.machines_used(), 2)
+        solution = search(p, budget=0.2, seed=0)
+        self.check(p, solution)
+        self.assertEqual(solution.machines_used(), 2)
+
+    def test_small_load_moves_to_small_machine(self):
+        "a machine's units move to the smallest machine holding them all"
+        p = problem([(4, 8, 100), (8, 16, 100), (32, 64, 100)],
+                    {'a': 1, 'b': 1}, (2, 1, 0))
+        solution = pack(p)
+        self.check(p, solution)
+        self.assertEqual(solution.machine_of, [0, 0])
+
+
+class SearchTestCase(unittest.TestCase):
+
+    """search() returns well before its budget when it can't improve."""
+
+    BUDGET = 60
+
+    def search(self, p):
+        start = time.monotonic()
+        solution = search(p, budget=self.BUDGET, seed=0)
+        self.assertLess(time.monotonic() - start, self.BUDGET / 10)
+        return solution
+
+    def test_unplaceable_unit(self):
+        p = problem([(4, 8, 100)] * 10, {'a': 3, 'b': 2}, (1, 1, 0))
+        p.units.append(Unit('c', AssignmentType.LXC, (1, 1, 0), 0,
+                            False, ()))
+        self.assertEqual(p.min_unplaced(), 1)
+        solution = self.search(p)
+        self.assertEqual(len(solution.unplaced()), 1)
+        self.assertEqual(solution.machines_used(), 3)
+
+    def test_lower_bound_out_of_reach(self):
+        "capacity forces more machines than lower_bound() says"
+        p = problem([(4, 8, 100)] * 10, {'a': 1, 'b': 1, 'c': 1},
+                    (3, 1, 0))
+        self.assertEqual(p.lower_bound(), 1)
+        solution = self.search(p)
+        self.assertEqual(solution.unplaced(), [])
+        self.assertEqual(solution.machines_used(), 3)
+
+
+class ParallelSearchTestCase(unittest.TestCase):
+
+    def test_workers_are_spawned(self):
+        p = problem([(4, 8, 100)] * 10, {'a': 3, 'b': 2}, (1, 1, 0))
+        with patch('bundleplacer.autoplacer.ProcessPoolExecutor',
+                   wraps=autoplacer.ProcessPoolExecutor) as pool:
+            solution = parallel_search(p, budget=0.1, workers=2)
+        self.assertEqual(pool.call_args[1]['mp_context'].get_start_method(),
+                         'spawn')
+        self.assertEqual(solution.unplaced(), [])
+        self.assertEqual(solution.machines_used(), 3)
+
+
+class FromCharmsTestCase(ControllerTestCase):
+
+    """Problems built from the sample bundle and MAAS nodes."""
+
+    def setUp(self):
+        super().setUp()
+        self.machines = FakeMaasState(NODES).machines(
+            state=MaasMachineStatus.READY)
+
+    def problem(self, metadata_filename=METADATA):
+        bundle = Bundle(BUNDLE, metadata_filename)
+        charms = [cc for cc in bundle.charm_classes if not cc.subordinate]
+        return PlacementProblem.from_charms(charms, self.machines)
+
+    def units(self, p, charm_name):
+        return [u for u in p.units if u.charm_name == charm_name]
+
+    def test_units_share_machines_by_default(self):
+        p = self.problem()
+        self.assertFalse(any(u.exclusive for u in p.units))
+        # nova-compute isn't allowed in LXC:
+        self.assertEqual(self.units(p, 'nova-compute')[0].atype,
+                         AssignmentType.KVM)
+        solution = pack(p)
+        self.assertEqual(solution.unplaced(), [])
+        # ceph and nova-compute have 3 units each:
+        self.assertEqual(solution.machines_used(), 3)
+
+    def test_isolate_from_metadata(self):
+        metadata = yamlio.load(open(METADATA).read())
+        metadata['services']['ceph'] = {'isolate': True}
+        filename = os.path.join(self.tmpdir.name, 'metadata.yaml')
+        with open(filename, 'w') as f:
+            yamlio.dump(metadata, f)
+
+        p = self.problem(filename)
+        for u in p.units:
+            self.assertEqual(u.exclusive, u.charm_name == 'ceph')
+        self.assertEqual(self.units(p, 'ceph')[0].atype,
+                         AssignmentType.BareMetal)
+        solution = pack(p)
+        self.assertEqual(solution.unplaced(), [])
+        self.assertEqual(solution.machines_used(), 6)
+
+    def test_autoassign_reports_machines_used(self):
+        pc = self.controller(FakeMaasState(NODES))
+        ok, msg = pc.autoassign_unassigned_services()
+        self.assertTrue(ok)
+        used = [iid for iid in pc.assignments if not pc.is_placeholder(iid)]
+        self.assertEqual(len(used), 3)
+        self.assertIn("on 3 machines", msg)
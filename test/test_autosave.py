@@ -0,0 +1,136 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from bundleplacer.autosave import AutosaveWriter
+from bundleplacer.filecache import write_atomic
+
+DELAY = 0.05
+
+
+class AutosaveWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.saves = []
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.filename = os.path.join(self.tmpdir.name, 'placement.yaml')
+
+    def writer(self, save=None, delay=DELAY, max_delay=10 * DELAY):
+        writer = AutosaveWriter(save or self.save, delay=delay,
+                                max_delay=max_delay)
+        self.addCleanup(writer.close)
+        return writer
+
+    def save(self):
+        self.saves.append(time.monotonic())
+
+    def wait_for_saves(self, n, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.saves) < n and time.monotonic() < deadline:
+            time.sleep(DELAY / 10)
+        self.assertGreaterEqual(len(self.saves), n)
+
+    def test_burst_is_one_save(self):
+        writer = self.writer()
+        for n in range(100):
+            writer.schedule()
+        self.wait_for_saves(1)
+        time.sleep(4 * DELAY)
+        self.assertEqual(len(self.saves), 1)
+        self.assertEqual(writer.writes, 1)
+
+    def test_saved_by_max_delay(self):
+        "a stream of changes closer together than delay is still saved"
+        max_delay = 4 * DELAY
+        writer = self.writer(max_delay=max_delay)
+        start = time.monotonic()
+        while time.monotonic() - start < 5 * max_delay:
+            writer.schedule()
+            time.sleep(DELAY / 5)
+        self.assertGreaterEqual(len(self.saves), 3)
+        # generous, saves are late when the machine is busy:
+        self.assertLess(self.saves[0] - start, 2 * max_delay)
+
+    def test_close_flushes(self):
+        writer = self.writer(delay=60, max_delay=60)
+        writer.schedule()
+        writer.close()
+        self.assertEqual(len(self.saves), 1)
+        self.assertFalse(writer._thread.is_alive())
+        # nothing is saved after closing:
+        writer.schedule()
+        writer.close()
+        self.assertEqual(len(self.saves), 1)
+
+    def test_file_never_partial(self):
+        "a reader sees the old or the new contents, whole"
+        versions = ["{}\n".format(n) * 100000 for n in range(2)]
+        write_atomic(self.filename, versions[0])
+        n_saves = [0]
+
+        def save():
+            n_saves[0] += 1
+            write_atomic(self.filename, versions[n_saves[0] % 2])
+
+        writer = self.writer(save=save, delay=0, max_delay=0)
+        done = threading.Event()
+
+        def change():
+            while not done.is_set():
+                writer.schedule()
+                time.sleep(0.001)
+
+        changer = threading.Thread(target=change)
+        changer.start()
+        try:
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                with open(self.filename) as f:
+                    self.assertIn(f.read(), versions)
+        finally:
+            done.set()
+            changer.join()
+        writer.close()
+        self.assertGreater(n_saves[0], 1)
+
+    def test_failed_write_keeps_old_contents(self):
+        write_atomic(self.filename, "old\n")
+        with patch('bundleplacer.filecache.os.fsync',
+                   side_effect=OSError("disk full")):
+            self.assertRaises(OSError, write_atomic, self.filename, "new\n")
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "old\n")
+        self.assertEqual(os.listdir(self.tmpdir.name), ['placement.yaml'])
+
+    def test_failed_save(self):
+        "the writer keeps going after a failed save"
+        def save():
+            self.save()
+            if len(self.saves) == 1:
+                raise OSError("disk full")
+
+        writer = self.writer(save=save)
+        writer.schedule()
+        self.wait_for_saves(1)
+        writer.schedule()
+        self.wait_for_saves(2)
+        self.assertEqual(writer.writes, 1)
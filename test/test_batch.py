@@ -0,0 +1,86 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import redirect_stderr
+import io
+import os
+
+from cloudinstall.maas import MaasMachineStatus
+
+from bundleplacer import batch
+from bundleplacer import yamlio
+
+from test_controller import NodesFileTestCase, BUNDLE, METADATA
+
+
+class BatchTestCase(NodesFileTestCase):
+
+    """Runs headless placement of the sample bundle on the MAAS nodes in
+    nodes_filename."""
+
+    def setUp(self):
+        super().setUp()
+        self.output_filename = os.path.join(self.tmpdir.name,
+                                            'placement.yaml')
+
+    def place(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            status = batch.main([BUNDLE, '--metadata', METADATA,
+                                 '--machines', self.nodes_filename,
+                                 '-o', self.output_filename, '--offline',
+                                 '--autoplace-strategy', 'ffd'])
+        return status, stderr.getvalue()
+
+    def load(self):
+        pc = self.controller()
+        with open(self.output_filename) as f:
+            pc.load(f)
+        return pc
+
+    def test_place(self):
+        status, msg = self.place()
+        self.assertEqual(status, 0)
+        self.assertIn("on 3 machines", msg)
+
+        with open(self.output_filename) as f:
+            placements = yamlio.load(f.read())
+        ready = set(n['resource_uri'] for n in self.nodes
+                    if n['status'] == MaasMachineStatus.READY.value)
+        self.assertEqual(len(placements), 3)
+        self.assertTrue(set(placements) <= ready)
+        pc = self.load()
+        self.assertTrue(pc.can_deploy())
+        for cc in pc.charm_classes():
+            if cc.is_core and not cc.subordinate:
+                self.assertEqual(pc.assignment_machine_count_for_charm(cc),
+                                 cc.required_num_units())
+
+    def test_too_few_machines(self):
+        # the bootstrap node and one READY machine, but ceph needs 3:
+        self.write_nodes(self.nodes[:2])
+        status, msg = self.place()
+        self.assertEqual(status, 1)
+        self.assertIn("Not enough empty machines", msg)
+        # what could be placed is still written:
+        pc = self.load()
+        self.assertFalse(pc.can_deploy())
+        self.assertGreater(len(pc.assigned_services), 0)
+
+    def test_missing_machines_file(self):
+        os.remove(self.nodes_filename)
+        status, msg = self.place()
+        self.assertEqual(status, 2)
+        self.assertFalse(os.path.exists(self.output_filename))
@@ -0,0 +1,89 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+
+from bundleplacer.bundle import Bundle
+
+from test_controller import ControllerTestCase, BUNDLE, METADATA
+
+
+class RefreshTestCase(ControllerTestCase):
+
+    """A Bundle on copies of the sample files, which tests rewrite."""
+
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.tmpdir.name, 'bundle.yaml')
+        shutil.copy(BUNDLE, self.filename)
+        self.bundle = Bundle(self.filename, METADATA)
+        self.before = {cc.charm_name: cc for cc in self.bundle.charm_classes}
+
+    def rewrite(self, text):
+        """Writes text to the bundle file, with an mtime a second later
+        than the current one, so the change is seen however coarse the
+        filesystem's timestamps are."""
+        st = os.stat(self.filename)
+        with open(self.filename, 'w') as f:
+            f.write(text)
+        later = st.st_mtime_ns + 10 ** 9
+        os.utime(self.filename, ns=(later, later))
+
+    def text(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_unchanged(self):
+        self.assertFalse(self.bundle.refresh())
+        self.assertIs(self.bundle.charm_classes, self.bundle.charm_classes)
+        self.assertEqual(self.bundle.revision, 1)
+
+    def test_changed_service_replaced(self):
+        text = self.text()
+        self.assertEqual(text.count('num_units: 3'), 2)
+        # ceph comes first:
+        self.rewrite(text.replace('num_units: 3', 'num_units: 5', 1) +
+                     "# scaled out ceph\n")
+
+        self.assertTrue(self.bundle.refresh())
+        self.assertEqual(self.bundle.revision, 2)
+        after = {cc.charm_name: cc for cc in self.bundle.charm_classes}
+        self.assertEqual(sorted(after), sorted(self.before))
+        for name, cc in after.items():
+            if name == 'ceph':
+                self.assertIsNot(cc, self.before[name])
+                self.assertEqual(cc.required_num_units(), 5)
+            else:
+                self.assertIs(cc, self.before[name])
+        self.assertIs(self.bundle.charm_class('ceph'), after['ceph'])
+
+    def test_touched_keeps_all(self):
+        "a reload that changes nothing keeps every charm"
+        self.rewrite(self.text() + "\n")
+        self.assertTrue(self.bundle.refresh())
+        for cc in self.bundle.charm_classes:
+            self.assertIs(cc, self.before[cc.charm_name])
+
+    def test_removed_service(self):
+        text = self.text()
+        start = text.index('\n  ntp:\n')
+        end = text.index('\n  openstack-dashboard:\n')
+        self.rewrite(text[:start] + text[end:])
+
+        self.assertTrue(self.bundle.refresh())
+        self.assertIsNone(self.bundle.charm_class('ntp'))
+        self.assertIs(self.bundle.charm_class('mysql'),
+                      self.before['mysql'])
@@ -0,0 +1,97 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+from unittest.mock import patch
+
+from bundleplacer.bundle import Bundle
+from bundleplacer.bundlecache import ParsedBundleCache, content_key
+from bundleplacer import yamlio
+
+from test_controller import ControllerTestCase, BUNDLE, METADATA
+
+
+class ParsedBundleCacheTestCase(ControllerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmpdir.name, 'bundle-cache')
+
+    def load(self, bundle_filename=BUNDLE):
+        """Returns the Bundle and the number of YAML documents parsed."""
+        with patch('bundleplacer.bundle.yamlio.load',
+                   wraps=yamlio.load) as load:
+            bundle = Bundle(bundle_filename, METADATA, cache_path=self.path)
+        return bundle, load.call_count
+
+    def entry(self):
+        entries = os.listdir(self.path)
+        self.assertEqual(len(entries), 1)
+        return os.path.join(self.path, entries[0])
+
+    def test_unchanged_files_not_parsed(self):
+        bundle, parsed = self.load()
+        self.assertEqual(parsed, 2)
+        cached, parsed = self.load()
+        self.assertEqual(parsed, 0)
+        self.assertEqual(cached._bundle, bundle._bundle)
+        self.assertEqual(cached._metadata, bundle._metadata)
+
+    def test_truncated_entry(self):
+        bundle, _ = self.load()
+        fn = self.entry()
+        with open(fn, 'r+b') as f:
+            f.truncate(os.path.getsize(fn) // 2)
+
+        reloaded, parsed = self.load()
+        self.assertEqual(parsed, 2)
+        self.assertEqual(reloaded._bundle, bundle._bundle)
+        # and the entry is written again:
+        self.assertEqual(self.load()[1], 0)
+
+    def test_entry_for_other_contents(self):
+        "an entry whose stored key doesn't match its name is ignored"
+        self.load()
+        fn = self.entry()
+        other = os.path.join(self.tmpdir.name, 'other.yaml')
+        with open(BUNDLE) as f:
+            bundle_text = f.read()
+        with open(other, 'w') as f:
+            f.write(bundle_text.replace('num_units: 3', 'num_units: 4', 1))
+        with open(other, 'rb') as f, open(METADATA, 'rb') as mf:
+            other_key = content_key(f.read(), mf.read())
+        shutil.copy(fn, os.path.join(self.path, other_key + '.pickle'))
+
+        bundle, parsed = self.load(other)
+        self.assertEqual(parsed, 2)
+        self.assertEqual(bundle._bundle, yamlio.load(open(other).read()))
+
+    def test_evicts_least_recently_used(self):
+        cache = ParsedBundleCache(self.path, max_entries=2)
+        for key in ('a', 'b'):
+            cache.put(key, key)
+        cache.get('a')
+        cache.put('c', 'c')
+        # another process sees the same entries:
+        cache = ParsedBundleCache(self.path, max_entries=2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('c'), 'c')
+
+    def test_cache_path_option(self):
+        self.config.setopt('bundle_cache_path', self.path)
+        self.controller()
+        self.assertEqual(len(os.listdir(self.path)), 1)
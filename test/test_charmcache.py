@@ -0,0 +1,190 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from bundleplacer.bundle import CharmStoreAPI
+from bundleplacer.charmcache import CharmMetadataCache
+
+TTL = 60
+
+
+def entity(name):
+    return {'Id': 'cs:trusty/{}-1'.format(name),
+            'Meta': {'charm-metadata': {'Name': name,
+                                        'Summary': name + ' summary'}}}
+
+
+class StubCharmStore:
+
+    """Stands in for theblues' CharmStore, counting lookups."""
+
+    def __init__(self, names):
+        self.entities = {name: entity(name) for name in names}
+        self.lookups = []
+        self.down = False
+
+    def entity(self, charm_name):
+        self.lookups.append(charm_name)
+        if self.down:
+            raise IOError("charm store unreachable")
+        return self.entities[charm_name]
+
+
+class Clock:
+
+    """Replaces the time module in charmcache, time() returns now."""
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'charmstore-cache')
+        self.clock = Clock()
+        clock = patch('bundleplacer.charmcache.time', self.clock)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+
+class CharmMetadataCacheTestCase(CacheTestCase):
+
+    def test_get_put(self):
+        cache = CharmMetadataCache(self.path, ttl=TTL)
+        self.assertIsNone(cache.get('mysql'))
+        cache.put('mysql', entity('mysql'))
+        self.assertEqual(cache.get('mysql'), entity('mysql'))
+        # another process sees it too:
+        cache = CharmMetadataCache(self.path, ttl=TTL)
+        self.assertEqual(cache.get('mysql'), entity('mysql'))
+
+    def test_ttl(self):
+        cache = CharmMetadataCache(self.path, ttl=TTL)
+        cache.put('mysql', entity('mysql'))
+        self.clock.now += TTL + 1
+        self.assertIsNone(cache.get('mysql'))
+        self.assertEqual(cache.get('mysql', allow_stale=True),
+                         entity('mysql'))
+
+    def test_unreadable_entry(self):
+        cache = CharmMetadataCache(self.path, ttl=TTL)
+        cache.put('mysql', entity('mysql'))
+        with open(cache._filename('mysql'), 'w') as f:
+            f.write('{"fetched": ')
+        self.assertIsNone(cache.get('mysql', allow_stale=True))
+
+    def test_evicts_least_recently_used(self):
+        cache = CharmMetadataCache(self.path, ttl=TTL, max_entries=2)
+        for name in ('mysql', 'keystone'):
+            cache.put(name, entity(name))
+            self.clock.now += 1
+        cache.get('mysql')
+        self.clock.now += 1
+        cache.put('glance', entity('glance'))
+
+        self.assertIsNone(cache.get('keystone'))
+        self.assertIsNotNone(cache.get('mysql'))
+        self.assertIsNotNone(cache.get('glance'))
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['glance.json', 'mysql.json'])
+
+    def test_ids_are_quoted(self):
+        cache = CharmMetadataCache(self.path, ttl=TTL)
+        cache.put('cs:~user/trusty/app', entity('app'))
+        self.assertEqual(cache.get('cs:~user/trusty/app'), entity('app'))
+        cache = CharmMetadataCache(self.path, ttl=TTL, max_entries=0)
+        cache.evict()
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class CharmStoreAPITestCase(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = StubCharmStore(['mysql', 'keystone'])
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        CharmStoreAPI.configure()
+        CharmStoreAPI._charmstore = None
+
+    def configure(self, **kwargs):
+        CharmStoreAPI.configure(cache_path=self.path, ttl=TTL, **kwargs)
+        CharmStoreAPI._charmstore = self.store
+
+    def test_lookup_is_cached(self):
+        self.configure()
+        self.assertEqual(CharmStoreAPI.lookup_charm('mysql'),
+                         entity('mysql'))
+        self.assertEqual(CharmStoreAPI.lookup_charm('mysql'),
+                         entity('mysql'))
+        self.assertEqual(self.store.lookups, ['mysql'])
+
+        # a new run is served from disk:
+        self.configure()
+        self.assertEqual(CharmStoreAPI.lookup_charm('mysql'),
+                         entity('mysql'))
+        self.assertEqual(self.store.lookups, ['mysql'])
+
+    def test_expired_entry_is_fetched_again(self):
+        self.configure()
+        CharmStoreAPI.lookup_charm('mysql')
+        self.clock.now += TTL + 1
+        self.configure()
+        CharmStoreAPI.lookup_charm('mysql')
+        self.assertEqual(self.store.lookups, ['mysql', 'mysql'])
+
+    def test_stale_fallback(self):
+        "an expired entry is used when the charm store can't be reached"
+        self.configure()
+        CharmStoreAPI.lookup_charm('mysql')
+        self.clock.now += TTL + 1
+        self.store.down = True
+        self.configure()
+        self.assertEqual(CharmStoreAPI.lookup_charm('mysql'),
+                         entity('mysql'))
+
+    def test_store_down_and_not_cached(self):
+        self.store.down = True
+        self.configure()
+        self.assertRaises(IOError, CharmStoreAPI.lookup_charm, 'mysql')
+
+    def test_offline(self):
+        self.configure()
+        CharmStoreAPI.lookup_charm('mysql')
+        self.clock.now += TTL + 1
+        self.configure(offline=True)
+        # stale entries are fine offline, misses are None:
+        self.assertEqual(CharmStoreAPI.lookup_charm('mysql'),
+                         entity('mysql'))
+        self.assertIsNone(CharmStoreAPI.lookup_charm('keystone'))
+        self.assertEqual(self.store.lookups, ['mysql'])
+
+    def test_prefetch(self):
+        self.configure()
+        CharmStoreAPI.prefetch(['mysql', 'keystone', 'mysql'])
+        self.assertEqual(sorted(self.store.lookups), ['keystone', 'mysql'])
+        CharmStoreAPI.lookup_charm('keystone')
+        self.assertEqual(len(self.store.lookups), 2)
@@ -0,0 +1,199 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloudinstall.maas import MaasMachineStatus
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.bundle import CharmStoreAPI
+from bundleplacer.config import Config
+from bundleplacer.controller import PlacementController
+from bundleplacer.fixtures.maas import FakeMaasState
+from bundleplacer import yamlio
+
+SHARE = os.path.join(os.path.dirname(__file__), '..', 'share')
+NODES = os.path.join(SHARE, 'maas-machines.json')
+BUNDLE = os.path.join(SHARE, 'openstack-base-38.yaml')
+METADATA = os.path.join(SHARE, 'openstack-base-38-metadata.yaml')
+
+
+class ControllerTestCase(unittest.TestCase):
+
+    """Runs each test with HOME in a temporary directory and the charm
+    store offline, so nothing outside the test is read or written."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        home = patch.dict(os.environ, {'HOME': self.tmpdir.name})
+        home.start()
+        self.addCleanup(home.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+        CharmStoreAPI.configure(offline=True)
+        self.addCleanup(CharmStoreAPI.configure)
+        self.config = Config('bundle-placer',
+                             {'bundle_filename': BUNDLE,
+                              'metadata_filename': METADATA})
+
+    def controller(self, maas_state=None):
+        return PlacementController(maas_state=maas_state,
+                                   config=self.config)
+
+
+class NodesFileTestCase(ControllerTestCase):
+
+    """Gives each test its own copy of the sample MAAS nodes, which it
+    can change with write_nodes()."""
+
+    def setUp(self):
+        super().setUp()
+        with open(NODES) as f:
+            self.nodes = json.load(f)
+        self.nodes_filename = os.path.join(self.tmpdir.name, 'nodes.json')
+        self.write_nodes(self.nodes)
+
+    def write_nodes(self, nodes):
+        with open(self.nodes_filename, 'w') as f:
+            json.dump(nodes, f)
+
+    def controller(self, maas_state=None):
+        if maas_state is None:
+            maas_state = FakeMaasState(self.nodes_filename)
+        return super().controller(maas_state)
+
+
+class SingleInstallTestCase(ControllerTestCase):
+
+    def test_gen_single_placeholders(self):
+        "placeholders built from juju constraints can be inventoried"
+        pc = self.controller()
+        pc.set_all_assignments(pc.gen_single())
+        ids = set(m.instance_id for m in pc.machines())
+        self.assertIn('controller', ids)
+        self.assertTrue(set(pc.assignments) <= ids)
+        self.assertTrue(pc.can_deploy())
+
+
+class UnknownMachinesTestCase(ControllerTestCase):
+
+    def test_placements_on_unknown_machines_dont_count(self):
+        "counts agree with get_assignments() for machines MAAS lacks"
+        pc = self.controller(FakeMaasState(NODES))
+        saved = {'/MAAS/api/1.0/nodes/gone-{}/'.format(i):
+                 {'assignments': {'LXC': [cc.charm_name]}}
+                 for i, cc in enumerate(pc.charm_classes())}
+        pc.load(io.StringIO(yamlio.dump(saved)))
+
+        for cc in pc.charm_classes():
+            self.assertEqual(dict(pc.get_assignments(cc)), {})
+            self.assertEqual(pc.assignment_machine_count_for_charm(cc), 0)
+        self.assertEqual(pc.assigned_services, set())
+        self.assertFalse(pc.can_deploy())
+
+
+class OrphanedUnitsTestCase(NodesFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pc = self.controller()
+        self.pc.autoassign_unassigned_services()
+        self.placed = {iid: {atype: list(al) for atype, al in
+                             self.pc.assignments.for_machine(iid).items()}
+                       for iid in self.pc.assignments}
+        self.victim = sorted(self.placed)[0]
+
+    def change_node(self, **fields):
+        for n in self.nodes:
+            if n['resource_uri'] == self.victim:
+                n.update(fields)
+        self.write_nodes(self.nodes)
+        self.pc.invalidate_nodes_cache()
+
+    def check_moved(self):
+        orphaned, unplaced = self.pc.replace_orphaned_units()
+        n = sum(len(al) for al in self.placed[self.victim].values())
+        self.assertEqual(len(orphaned), n)
+        self.assertNotIn(self.victim, self.pc.assignments)
+        for iid, ad in self.placed.items():
+            if iid != self.victim:
+                self.assertEqual(dict(self.pc.assignments.for_machine(iid)),
+                                 ad)
+
+    def test_nothing_changed(self):
+        self.assertEqual(self.pc.replace_orphaned_units(), ([], []))
+
+    def test_removed_machine(self):
+        self.nodes = [n for n in self.nodes
+                      if n['resource_uri'] != self.victim]
+        self.change_node()
+        self.check_moved()
+
+    def test_machine_no_longer_ready(self):
+        self.change_node(status=MaasMachineStatus.BROKEN.value)
+        self.check_moved()
+
+    def test_machine_no_longer_satisfies(self):
+        for al in self.placed[self.victim].values():
+            for cc in al:
+                cc.constraints = {'mem': 2}
+        self.change_node(memory=1)
+        self.check_moved()
+
+
+class NotReadyMachinesTestCase(NodesFileTestCase):
+
+    """Assignments the user made to machines that weren't READY at the
+    time are never treated as orphaned."""
+
+    def setUp(self):
+        super().setUp()
+        self.nodes[-1]['status'] = MaasMachineStatus.ALLOCATED.value
+        self.write_nodes(self.nodes)
+        self.pc = self.controller()
+        self.machine = self.pc.machine_by_id(self.nodes[-1]['resource_uri'])
+        self.cc = self.pc.charm_classes()[0]
+        self.pc.assign(self.machine, self.cc, AssignmentType.LXC)
+
+    def add_unrelated_node(self):
+        node = dict(self.nodes[1],
+                    resource_uri='/MAAS/api/1.0/nodes/node-new/',
+                    system_id='node-new', hostname='new.maas')
+        self.write_nodes(self.nodes + [node])
+        self.pc.invalidate_nodes_cache()
+
+    def check_kept(self):
+        self.assertEqual(self.pc.replace_orphaned_units(), ([], []))
+        self.assertTrue(self.pc.is_assigned_to(self.cc, self.machine))
+
+    def test_unrelated_change(self):
+        self.add_unrelated_node()
+        self.check_kept()
+
+    def test_full_scan(self):
+        f = io.StringIO()
+        self.pc.save(f)
+        self.pc.load(io.StringIO(f.getvalue()))
+        self.add_unrelated_node()
+        self.check_kept()
+
+    def test_unrelated_reset(self):
+        self.add_unrelated_node()
+        self.pc.reset_assigned_deployed()
+        self.check_kept()
@@ -0,0 +1,79 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+import unittest
+
+from bundleplacer.inventory import MachineInventory, HISTORY_LENGTH
+
+Machine = namedtuple('Machine', ['instance_id', 'hostname', 'status', 'arch',
+                                 'cpu_cores', 'mem', 'storage'])
+
+
+def machine(iid, status='ready', mem=1024):
+    return Machine(iid, iid, status, 'amd64', 1, mem, 10)
+
+
+class DiffSinceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.machines = {iid: machine(iid) for iid in 'abc'}
+        self.inventory = MachineInventory(
+            lambda: list(self.machines.values()), ttl=None)
+        self.inventory.refresh()
+        self.start = self.inventory.generation
+
+    def update(self, **machines):
+        """Replaces machines, removing those given as None, and takes a
+        new snapshot."""
+        for iid, m in machines.items():
+            if m is None:
+                del self.machines[iid]
+            else:
+                self.machines[iid] = m
+        self.inventory.refresh()
+
+    def diff(self):
+        return self.inventory.diff_since(self.start)
+
+    def test_unchanged(self):
+        self.assertFalse(self.inventory.refresh())
+        self.assertEqual(self.diff(), (set(), set(), set()))
+
+    def test_added_removed_changed(self):
+        self.update(d=machine('d'), a=None, b=machine('b', mem=2048))
+        self.update(c=machine('c', status='broken'))
+        self.assertEqual(self.diff(), ({'d'}, {'a'}, {'b', 'c'}))
+
+    def test_removed_then_back_is_changed(self):
+        self.update(a=None)
+        self.update(a=machine('a', mem=4096))
+        self.assertEqual(self.diff(), (set(), set(), {'a'}))
+
+    def test_added_then_removed_is_nothing(self):
+        self.update(d=machine('d'))
+        self.update(d=None)
+        self.assertEqual(self.diff(), (set(), set(), set()))
+
+    def test_unchanged_machines_keep_identity(self):
+        before = self.inventory.by_id['a']
+        self.update(b=machine('b', mem=2048))
+        self.assertIs(self.inventory.by_id['a'], before)
+
+    def test_too_old(self):
+        for n in range(HISTORY_LENGTH + 1):
+            self.update(a=machine('a', mem=n))
+        self.assertIsNone(self.diff())
+        self.assertIsNone(self.inventory.diff_since(None))
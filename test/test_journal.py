@@ -0,0 +1,102 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.fixtures.maas import FakeMaasState
+from bundleplacer.journal import journal_filename
+
+from test_controller import ControllerTestCase, NODES
+
+
+class JournalTestCase(ControllerTestCase):
+
+    """Edits are journaled after the first compaction, and load()
+    replays them without the autosave file being rewritten."""
+
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.tmpdir.name, 'placement.yaml')
+        self.pc = self.controller(FakeMaasState(NODES))
+        self.pc.set_autosave_filename(self.filename)
+        self.addCleanup(self.pc.set_autosave_filename, None)
+        self.machines = self.pc.machines(include_placeholders=False)
+        self.charms = self.pc.charm_classes()
+
+        # not journaled, starts the journal:
+        self.pc.assign(self.machines[0], self.charms[0], AssignmentType.LXC)
+        self.pc.flush_autosave()
+        with open(self.filename) as f:
+            self.snapshot = f.read()
+
+        m0, m1, m2 = self.machines[:3]
+        c1, c2, c3 = self.charms[1:4]
+        self.pc.assign(m1, c1, AssignmentType.KVM)
+        self.pc.assign(m1, c2, AssignmentType.LXC)
+        self.pc.assign(m2, c3, AssignmentType.LXC)
+        self.pc.mark_deployed(m2, c3, AssignmentType.LXC)
+        self.pc.remove_one_assignment(m1, c1)
+        self.pc.clear_assignments(m0)
+        self.pc.assign(m0, c1, AssignmentType.BareMetal)
+
+    def saved(self, pc):
+        f = io.StringIO()
+        pc.save(f)
+        return f.getvalue()
+
+    def reload(self, mode='r'):
+        pc = self.controller(FakeMaasState(NODES))
+        with open(self.filename, mode) as f:
+            pc.load(f)
+        return pc
+
+    def test_edits_are_journaled(self):
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), self.snapshot)
+        self.assertEqual(self.pc._journal.records, 7)
+
+    def test_replay(self):
+        self.assertEqual(self.saved(self.reload()), self.saved(self.pc))
+
+    def test_replay_binary_file(self):
+        self.assertEqual(self.saved(self.reload('rb')), self.saved(self.pc))
+
+    def test_replay_clear_all(self):
+        self.pc.clear_all_assignments()
+        pc = self.reload()
+        self.assertEqual(len(pc.assignments), 0)
+        self.assertEqual(self.saved(pc), self.saved(self.pc))
+
+    def test_incomplete_record_ends_replay(self):
+        with open(journal_filename(self.filename), 'a') as f:
+            f.write('{"op": "clear_al')
+        self.assertEqual(self.saved(self.reload()), self.saved(self.pc))
+
+    def test_stale_journal_ignored(self):
+        "a snapshot written after the journal started wins"
+        pc = self.controller(FakeMaasState(NODES))
+        with open(self.filename, 'w') as f:
+            pc.save(f)
+        self.assertEqual(len(self.reload().assignments), 0)
+
+    def test_flush_compacts(self):
+        expected = self.saved(self.pc)
+        self.pc.flush_autosave()
+        self.assertEqual(self.pc._journal.records, 0)
+        with open(self.filename) as f:
+            self.assertNotEqual(f.read(), self.snapshot)
+        self.assertEqual(self.saved(self.reload()), expected)
@@ -0,0 +1,115 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+from unittest.mock import patch
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.ui.machines_list import MachinesList, MachineWalker
+
+from test_controller import NodesFileTestCase
+
+
+class MachineWalkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.walker = MachineWalker(make_row=lambda iid: (None, iid))
+        self.ids = ['h{}'.format(i) for i in range(1050)]
+        self.walker.set_instance_ids(self.ids)
+        self.walker.set_focus(499)
+
+    def test_focused_machine_kept(self):
+        self.walker.set_instance_ids(self.ids[400:600])
+        self.assertEqual(self.walker.focus_instance_id(), 'h499')
+
+    def test_focused_machine_filtered_out(self):
+        "focus goes to the first match, not the last"
+        self.walker.set_instance_ids([iid for iid in self.ids
+                                      if iid.startswith('h19')])
+        self.assertEqual(self.walker.focus, 0)
+
+    def test_empty(self):
+        self.walker.set_instance_ids([])
+        self.assertIsNone(self.walker.focus_instance_id())
+
+    def test_vanished_machines_skipped(self):
+        gone = set(self.ids[500:510])
+        self.walker.make_row = lambda iid: None if iid in gone \
+            else (None, iid)
+        self.assertEqual(self.walker.get_next(499), ('h510', 510))
+        self.assertEqual(self.walker.get_prev(510), ('h499', 499))
+        self.walker.set_focus(505)
+        self.assertEqual(self.walker.get_focus(), ('h510', 510))
+        self.assertNotIn('h505', self.walker.rows)
+
+
+class CountingWidget:
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+class MachineWalkerRefreshTestCase(unittest.TestCase):
+
+    def test_navigation_doesnt_update_rows(self):
+        walker = MachineWalker(make_row=lambda iid: (CountingWidget(), iid))
+        walker.set_instance_ids(['a', 'b', 'c'])
+        for n in range(3):
+            walker.get_focus()
+            walker.get_next(1)
+            walker.get_prev(2)
+        self.assertEqual([mw.updates for mw, _ in walker.rows.values()],
+                         [0, 0, 0])
+
+
+class MachinesListTestCase(NodesFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pc = self.controller()
+        self.ml = MachinesList(self.pc, [], show_hardware=True)
+
+    def render(self):
+        return self.ml.render((80,))
+
+    def test_snapshot_kept_between_polls(self):
+        "a node removed in MAAS stays listed until the next poll"
+        self.render()
+        removed = self.nodes[1]['resource_uri']
+        self.write_nodes(self.nodes[:1] + self.nodes[2:])
+        later = time.monotonic() + 3600
+        with patch('bundleplacer.inventory.time.monotonic',
+                   return_value=later):
+            self.render()
+            self.assertIsNotNone(self.pc.machine_by_id(removed))
+
+        self.pc.invalidate_nodes_cache()
+        self.ml.update()
+        self.render()
+        self.assertIsNone(self.pc.machine_by_id(removed))
+        self.assertNotIn(removed, self.ml.walker.instance_ids)
+
+    def test_update_refreshes_built_rows(self):
+        self.render()
+        m = self.pc.machines(include_placeholders=False)[0]
+        mw = self.ml.walker.cached_widget(m.instance_id)
+        self.pc.assign(m, self.pc.charm_classes()[0], AssignmentType.LXC)
+        self.ml.update()
+        self.assertEqual(mw.rendered_revision,
+                         self.pc.machine_placement_revision(m))
@@ -0,0 +1,64 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import patch
+
+from urwid import Overlay
+from ubuntui.views import InfoDialogWidget
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer.placerview import PlacerView
+
+from test_controller import NodesFileTestCase
+
+
+class PollInventoryTestCase(NodesFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        event_loop = patch('bundleplacer.placerview.EventLoop')
+        event_loop.start()
+        self.addCleanup(event_loop.stop)
+
+    def test_poll_replaces_units_on_removed_machine(self):
+        pc = self.controller()
+        pv = PlacerView(pc, self.config)
+        m = pc.machines(include_placeholders=False)[0]
+        cc = pc.charm_classes()[0]
+        pc.assign(m, cc, AssignmentType.LXC)
+
+        self.write_nodes([n for n in self.nodes
+                          if n['resource_uri'] != m.instance_id])
+        with patch('bundleplacer.placerview.InfoDialogWidget',
+                   wraps=InfoDialogWidget) as dialog:
+            pv.poll_inventory()
+
+        self.assertNotIn(m.instance_id, pc.assignments)
+        self.assertEqual(pc.assignment_machine_count_for_charm(cc), 1)
+        self.assertEqual(pv.machines_revision, pc.machines_revision)
+
+        # and tells the user:
+        message, close = dialog.call_args[0]
+        self.assertIn("1 x {}".format(cc.charm_name), message)
+        self.assertIsInstance(pv.pv._w, Overlay)
+        close(pv.pv._w.top_w)
+        self.assertNotIsInstance(pv.pv._w, Overlay)
+
+    def test_poll_without_orphans_says_nothing(self):
+        pc = self.controller()
+        pv = PlacerView(pc, self.config)
+        self.write_nodes(self.nodes[:-1])
+        pv.poll_inventory()
+        self.assertNotIsInstance(pv.pv._w, Overlay)
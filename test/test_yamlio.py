@@ -0,0 +1,81 @@
+# Copyright 2016 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import unittest
+
+from bundleplacer.assignmenttype import AssignmentType
+from bundleplacer import yamlio
+
+from test_controller import NodesFileTestCase
+
+# as written by PlacementController.save() before it switched to the
+# safe dumper:
+OLD_SAVE = """\
+!!python/object/apply:collections.defaultdict
+args: [!!python/name:builtins.dict '']
+dictitems:
+  /MAAS/api/1.0/nodes/node-two/:
+    assignments:
+      LXC: [mysql, keystone]
+      KVM: [nova-compute]
+  /MAAS/api/1.0/nodes/node-three/:
+    assignments:
+      BareMetal: [ceph]
+"""
+
+OLD_EMPTY_SAVE = """\
+!!python/object/apply:collections.defaultdict
+- !!python/name:builtins.dict ''
+"""
+
+
+class LoadTestCase(unittest.TestCase):
+
+    def test_old_defaultdict(self):
+        self.assertEqual(yamlio.load(OLD_SAVE), {
+            '/MAAS/api/1.0/nodes/node-two/': {
+                'assignments': {'LXC': ['mysql', 'keystone'],
+                                'KVM': ['nova-compute']}},
+            '/MAAS/api/1.0/nodes/node-three/': {
+                'assignments': {'BareMetal': ['ceph']}}})
+
+    def test_old_empty_defaultdict(self):
+        self.assertEqual(yamlio.load(OLD_EMPTY_SAVE), {})
+
+    def test_other_python_tags_refused(self):
+        self.assertRaises(yamlio.yaml.YAMLError, yamlio.load,
+                          "!!python/object/apply:os.system ['true']")
+
+
+class ControllerLoadTestCase(NodesFileTestCase):
+
+    def test_load_old_save(self):
+        pc = self.controller()
+        pc.load(io.StringIO(OLD_SAVE))
+        node = pc.machine_by_id('/MAAS/api/1.0/nodes/node-two/')
+        names = {atype: [cc.charm_name for cc in al]
+                 for atype, al in pc.assignments_for_machine(node).items()
+                 if len(al) > 0}
+        self.assertEqual(names, {AssignmentType.LXC: ['mysql', 'keystone'],
+                                 AssignmentType.KVM: ['nova-compute']})
+
+        saved = io.StringIO()
+        pc.save(saved)
+        saved.seek(0)
+        other = self.controller()
+        other.load(saved)
+        self.assertEqual(other.assignments_for_machine(node),
+                         pc.assignments_for_machine(node))
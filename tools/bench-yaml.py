@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# Compares YAML loading of bundles with the pure python and libyaml
+# loaders, over the bundles in share/ and generated large bundles.
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bundleplacer import yamlio  # noqa
+
+
+def parse_options(argv):
+    parser = argparse.ArgumentParser(description="bench-yaml",
+                                     prog="bench-yaml")
+    parser.add_argument('-n', '--services', dest='services', type=int,
+                        default=1000,
+                        help='Number of services in the generated bundle')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int,
+                        default=5,
+                        help='Number of loads to time for each file')
+    return parser.parse_args(argv)
+
+
+def generated_bundle(n):
+    services = {}
+    for i in range(n):
+        services['service-{}'.format(i)] = {
+            'charm': 'cs:trusty/charm-{}-{}'.format(i % 50, i % 7),
+            'num_units': 1 + i % 3,
+            'options': {'option-{}'.format(j): 'value-{}'.format(j)
+                        for j in range(5)},
+            'annotations': {'gui-x': str(i * 10.5),
+                            'gui-y': str(i * 3.25)}}
+    relations = [['service-{}:db'.format(i),
+                  'service-{}:db'.format((i + 1) % n)] for i in range(n)]
+    return yaml.dump({'services': services, 'relations': relations,
+                      'series': 'trusty'}, Dumper=yamlio.Dumper,
+                     default_flow_style=False)
+
+
+def bench(text, repeat):
+    pure = min(timeit.repeat(lambda: yaml.load(text, Loader=yaml.SafeLoader),
+                             number=1, repeat=repeat))
+    fast = min(timeit.repeat(lambda: yamlio.load(text),
+                             number=1, repeat=repeat))
+    return pure, fast
+
+
+def main():
+    opts = parse_options(sys.argv[1:])
+    if not yamlio.HAVE_LIBYAML:
+        print("PyYAML was built without libyaml, both loaders are the "
+              "pure python one.")
+
+    share = os.path.join(os.path.dirname(__file__), '..', 'share')
+    inputs = []
+    for fn in sorted(glob.glob(os.path.join(share, '*.yaml'))):
+        with open(fn) as f:
+            inputs.append((os.path.basename(fn), f.read()))
+    inputs.append(("generated, {} services".format(opts.services),
+                   generated_bundle(opts.services)))
+
+    print("{:<45} {:>10} {:>10} {:>8}".format("file", "python ms",
+                                              "libyaml ms", "speedup"))
+    for name, text in inputs:
+        pure, fast = bench(text, opts.repeat)
+        print("{:<45} {:10.2f} {:10.2f} {:7.1f}x".format(
+            name, pure * 1000, fast * 1000, pure / fast))
+
+
+if __name__ == '__main__':
+    main()